@@ -0,0 +1,252 @@
+"""합성 원장 벤치마크: 계산 경로와 HTML 렌더 경로의 단계별 소요 시간
+
+portfolio.py를 Streamlit 런타임 없이(bare mode) 실행하고, conn.read /
+FinanceDataReader / yfinance 는 합성 데이터를 돌려주는 스텁으로 대체한다.
+계산 코어(portfolio_core)는 화면 없이 따로도 잰다 (core:* 단계).
+규모(총 거래 수)별로 단계 시간을 재서 JSON으로 출력한다.
+
+    python benchmarks/bench_portfolio.py --trades 1000 10000 100000 --codes 40 --output bench.json
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import runpy
+import statistics
+import sys
+import tempfile
+import time
+import zlib
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+ROOT = Path(__file__).resolve().parent.parent
+SCRIPT = ROOT / "portfolio.py"
+sys.path.insert(0, str(ROOT))
+
+import portfolio_core as core  # noqa: E402
+
+TRADE_ACCOUNTS = ["ISA", "Pension", "IRP", "ETF", "US", "사주"]
+ASSET_TYPES = ["S&P", "나스닥", "TDF", "전력", "섹터"]
+STRATEGY_NAMES = ["US Market", "US AI Power", "US Wrap", "KR Leverage", "KR Sector", "Total"]
+
+
+# --- 합성 데이터 ---
+def make_codes(acct, n_codes):
+    if acct == "US":
+        return [f"US{i:03d}" for i in range(n_codes)]
+    if acct in ("IRP", "ETF"):
+        # 시트는 숫자 코드를 정수로 읽어 펀드 코드(문자)와 섞인 열이 됨
+        return [100000 + i if i % 2 == 0 else f"K{100000 + i:06d}" for i in range(n_codes)]
+    return [f"{100000 + i:06d}" for i in range(n_codes)]
+
+def make_trade_sheet(rng, acct, n_trades, n_codes, start):
+    codes = np.array(make_codes(acct, n_codes), dtype=object)
+    code_idx = rng.integers(0, n_codes, n_trades)
+    qty = rng.integers(1, 50, n_trades)
+    price = rng.uniform(5, 500, n_trades).round(2)
+    return pd.DataFrame({
+        "거래일": (start + pd.to_timedelta(np.sort(rng.integers(0, 1500, n_trades)), "D")).strftime("%Y-%m-%d"),
+        "계좌명": acct,
+        "종목코드": codes[code_idx],
+        "종목명": [f"{acct} 종목 {i}" for i in code_idx],
+        "유형": np.array(ASSET_TYPES)[code_idx % len(ASSET_TYPES)],
+        "구분": np.where(rng.random(n_trades) < 0.7, "매수", "매도"),
+        "수량": qty,
+        "단가": price,
+        "제세금": (qty * price * 0.00015).round(0),
+        "거래금액": (qty * price).round(0),
+        "현재가": np.where(rng.random(n_trades) < 0.1, price, np.nan),
+    })
+
+def make_sheets(n_trades, n_codes, seed=0):
+    """워크시트 이름 -> DataFrame (conn.read 응답과 같은 형태)"""
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp("2021-01-04")
+    per_account = max(n_trades // len(TRADE_ACCOUNTS), 1)
+
+    sheets = {
+        acct: make_trade_sheet(rng, acct, per_account, n_codes, start)
+        for acct in TRADE_ACCOUNTS
+    }
+
+    n_cash = max(per_account // 10, 10)
+    sheets["입출금"] = pd.DataFrame({
+        "거래일": (start + pd.to_timedelta(rng.integers(0, 1500, n_cash), "D")).strftime("%Y-%m-%d"),
+        "계좌명": rng.choice(TRADE_ACCOUNTS, n_cash),
+        "구분": np.where(rng.random(n_cash) < 0.9, "입금", "출금"),
+        "금액": rng.integers(100_000, 5_000_000, n_cash),
+    })
+
+    n_div = max(per_account // 20, 10)
+    sheets["배당"] = pd.DataFrame({
+        "배당일": (start + pd.to_timedelta(rng.integers(0, 1500, n_div), "D")).strftime("%Y-%m-%d"),
+        "계좌명": rng.choice(TRADE_ACCOUNTS, n_div),
+        "유형": rng.choice(ASSET_TYPES, n_div),
+        "배당금": rng.integers(1_000, 100_000, n_div),
+    })
+
+    sheets["LV"] = pd.DataFrame({
+        "거래일": (start + pd.to_timedelta(rng.integers(0, 1500, 200), "D")).strftime("%Y-%m-%d"),
+        "손익": rng.integers(-500_000, 500_000, 200),
+    })
+
+    month_ends = pd.date_range(start, periods=24, freq="ME")
+    sheets["성과"] = pd.DataFrame([
+        {
+            "기준일": f"{date:%Y-%m-%d}",
+            "전략": name,
+            "평가액": int(rng.integers(10_000_000, 100_000_000)),
+            "누적수익": int(rng.integers(-5_000_000, 20_000_000)),
+            "월간수익": int(rng.integers(-2_000_000, 2_000_000)),
+            "월간수익률": float(rng.uniform(-0.05, 0.05)),
+            "운용증가": int(rng.integers(0, 1_000_000)),
+        }
+        for date in month_ends for name in STRATEGY_NAMES
+    ])
+    return sheets
+
+
+# --- 데이터 소스 스텁 ---
+class FakeConnection:
+    """GSheetsConnection.read 대체: 헤더 없는 단일 셀 조회(WRAP, 별도예수금)도 흉내"""
+
+    def __init__(self, sheets):
+        self.sheets = sheets
+
+    def read(self, worksheet, ttl=None, usecols=None, nrows=None, header=0, **kwargs):
+        if header is None and worksheet == "WRAP":
+            return pd.DataFrame([[50_000.0, 56_000.0, 1_400.0]])
+        if header is None and worksheet == "입출금":
+            return pd.DataFrame([[3_000_000.0]])
+        return self.sheets[worksheet].copy()
+
+def fake_closes(seed_key, start, end):
+    dates = pd.bdate_range(start, end)
+    rng = np.random.default_rng(zlib.crc32(seed_key.encode()))
+    return pd.Series(rng.uniform(5, 500) * np.cumprod(1 + rng.normal(0, 0.01, len(dates))), index=dates)
+
+def fake_fdr_reader(code, start=None, end=None, *args, **kwargs):
+    end = pd.Timestamp(end or pd.Timestamp.now().normalize())
+    start = pd.Timestamp(start or end - pd.Timedelta(days=30))
+    return pd.DataFrame({"Close": fake_closes(code, start, end)})
+
+def fake_yf_download(tickers, start=None, end=None, *args, **kwargs):
+    tickers = [tickers] if isinstance(tickers, str) else list(tickers)
+    closes = pd.DataFrame({code: fake_closes(code, start, end) for code in tickers})
+    return pd.concat({"Close": closes}, axis=1)
+
+
+# --- 측정 ---
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return {"median_s": statistics.median(samples), "min_s": min(samples)}
+
+@contextlib.contextmanager
+def fake_quotes():
+    with mock.patch("FinanceDataReader.DataReader", fake_fdr_reader), \
+            mock.patch("yfinance.download", fake_yf_download):
+        yield
+
+def run_script(conn, tab):
+    with mock.patch("streamlit.connection", return_value=conn), \
+            mock.patch("streamlit_option_menu.option_menu", return_value=tab), \
+            fake_quotes():
+        return runpy.run_path(str(SCRIPT))
+
+def bench_scale(n_trades, n_codes, repeat):
+    st.cache_data.clear()
+    st.cache_resource.clear()
+    conn = FakeConnection(make_sheets(n_trades, n_codes))
+    stages = {}
+
+    # 전체 스크립트 재실행 (첫 실행은 스냅샷·시세·포지션 캐시가 비어 있음)
+    started = time.perf_counter()
+    ns = run_script(conn, "성과")
+    elapsed = time.perf_counter() - started
+    stages["script_cold:성과"] = {"median_s": elapsed, "min_s": elapsed}
+    for tab in ["성과", "전체", "ISA"]:
+        stages[f"script_warm:{tab}"] = timed(lambda: run_script(conn, tab), repeat)
+
+    # 화면 없이 계산 코어만: 시트 정제, 계산 입력(시세 TTL 적중), 전체 계산 그래프
+    def headless_report():
+        with fake_quotes():
+            graph = core.PortfolioGraph(core.prepare_inputs(ns["snapshot"], ns["ref_date"], False))
+            for name in core.COMPUTE_NODES:
+                graph.compute(name)
+
+    stages["core:build_snapshot"] = timed(lambda: core.build_snapshot(conn), repeat)
+    stages["core:report"] = timed(headless_report, repeat)
+
+    inputs = ns["inputs"]
+    trade_dfs, cash_df, df_dividend, price_map = inputs.trade_dfs, inputs.cash_df, inputs.df_dividend, inputs.price_map
+    accounts = core.LOCAL_ACCOUNTS + ["US"]
+
+    def account_summaries(state):
+        for acct in accounts:
+            core.calculate_account_summary(
+                trade_dfs[acct], cash_df[cash_df["계좌명"] == acct], df_dividend, price_map,
+                state_key=acct if state else None,
+            )
+
+    stages["calculate_account_summary:full_replay"] = timed(lambda: account_summaries(False), repeat)
+    stages["calculate_account_summary:snapshot"] = timed(lambda: account_summaries(True), repeat)
+
+    def strategies_by_type():
+        graph = core.PortfolioGraph(inputs)
+        core.calculate_strategy_by_type(graph, ["S&P", "나스닥", "TDF"])
+        core.calculate_strategy_by_type(graph, "전력")
+
+    stages["calculate_strategy_by_type"] = timed(strategies_by_type, repeat)
+
+    def monthly_performance():
+        performance_df = ns["snapshot"].sheet("성과").sort_values("기준일", ascending=False)
+        ns["build_monthly_performance_html"](performance_df, core.monthly_totals(performance_df),
+                                             ns["strategies"], ns["total_strategy_value"])
+
+    stages["monthly_performance"] = timed(monthly_performance, repeat)
+
+    df_summary, summary = ns["compute"]("local_total")
+    stages["html:holdings_card"] = timed(lambda: ns["build_holdings_card"](
+        df_summary, "전체", "#EDE5D9", "", summary["current_value"], summary["today_profit"], summary["current_profit"]
+    ), repeat)
+    stages["html:strategy_card"] = timed(lambda: ns["build_strategy_html"](ns["strategies"]), repeat)
+
+    return {"trades": n_trades, "codes": n_codes, "holdings": len(df_summary), "stages": stages}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--trades", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--codes", type=int, default=40, help="계좌당 종목 수")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="JSON 저장 경로 (기본: 표준출력)")
+    args = parser.parse_args(argv)
+
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+    report = []
+    for n_trades in args.trades:
+        # 포지션 스냅샷·일봉 저장소는 규모별 임시 디렉터리에
+        with tempfile.TemporaryDirectory() as cache_dir:
+            os.environ["PORTFOLIO_CACHE_DIR"] = cache_dir
+            core.set_cache_dir(cache_dir)
+            report.append(bench_scale(n_trades, args.codes, args.repeat))
+        print(f"{n_trades:>8,} trades: script_warm:성과 "
+              f"{report[-1]['stages']['script_warm:성과']['median_s'] * 1000:.1f} ms", file=sys.stderr)
+
+    payload = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(payload, encoding="utf-8")
+    else:
+        print(payload)
+
+if __name__ == "__main__":
+    main()
@@ -1,353 +1,145 @@
 import streamlit as st
 import pandas as pd
-import FinanceDataReader as fdr
-import yfinance as yf
+import threading
 from datetime import datetime, timedelta
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 from streamlit_option_menu import option_menu
 from streamlit_gsheets import GSheetsConnection
 from textwrap import dedent
 
+# 계산 코어 (시트 적재, 시세, 원장 재생, 계산 그래프): Streamlit 없이도 동작, CLI와 공유
+from portfolio_core import (
+    LEDGER_BACKEND,
+    LOCAL_ACCOUNTS,
+    NAV_COLUMNS,
+    PERFORMANCE_STRATEGY_NAMES,
+    QUOTE_REFRESH_INTERVAL,
+    SNAPSHOT_TTL,
+    TAPE_DIR,
+    TAPE_MODE,
+    LedgerSync,
+    LocalLedgerStore,
+    PerformanceIndex,
+    PortfolioGraph,
+    build_snapshot,
+    current_date,
+    live_prices,
+    monthly_totals,
+    nav_report,
+    open_ledger,
+    performance_history,
+    performance_rows,
+    prepare_inputs,
+    start_trace,
+    sync_ledger,
+    write_trace,
+)
+
 
 # --- Streamlit 구성시작 ---
-st.set_page_config(layout="wide")
+st.set_page_config(layout="wide", initial_sidebar_state="collapsed")
 
-# --- 기본 설정 ---
-ACCOUNT_NAMES = ["ISA", "Pension", "IRP", "ETF", "US", "사주", "LV"]
+# 성능 추적: 재실행 1회의 구간별 소요, 캐시 적중, 시세 조회 지연
+trace = start_trace()
 
 # ============================================================
-# 기준일자 설정 (None = 현재가 기준 / 날짜 입력시 해당일 기준)
+# 기준일자 기본값 (None = 현재가 기준 / 날짜 입력시 해당일 기준)
 # 예시: REFERENCE_DATE = "2026-02-28"
+# 실행 중에는 사이드바의 기준일 선택으로 변경
 # ============================================================
 
 REFERENCE_DATE = None  # None or "YYYY-MM-DD"
+AUTO_REFRESH_INTERVAL = 60  # 초, 자동 새로고침 주기 (계좌 탭 카드만 다시 계산)
 
-# 기준일 파싱
-if REFERENCE_DATE:
-    ref_date = pd.Timestamp(REFERENCE_DATE)
-    is_historical = True
-else:
-    ref_date = pd.Timestamp(datetime.now().date())
-    is_historical = False
+# 기준일 선택 (오늘이면 현재가 기준, 과거 날짜면 해당일 기준, 재생 모드의 오늘은 기록한 날짜)
+today = current_date().date()
+with st.sidebar:
+    picked_date = st.date_input(
+        "기준일",
+        value=pd.Timestamp(REFERENCE_DATE).date() if REFERENCE_DATE else today,
+        max_value=today,
+        key="ref_date",
+    )
+ref_date = pd.Timestamp(picked_date)
+is_historical = ref_date < pd.Timestamp(today)
 
 
 # --- 엑셀 파일 경로 설정 ---
-conn = st.connection("gsheets", type=GSheetsConnection)
+# 원장 데이터 소스: PORTFOLIO_LEDGER = gsheets(기본) | csv:<디렉터리> | local(로컬 저장소 + 백그라운드 동기화)
+# 재생 모드(PORTFOLIO_TAPE_MODE=replay)는 보관소로만 응답하므로 연결 없이 실행
+def open_sheets():
+    return st.connection("gsheets", type=GSheetsConnection)
+
+def script_ctx_initializer():
+    """시트 조회 워커 스레드에 현재 실행 컨텍스트 연결"""
+    ctx = get_script_run_ctx()
+    return lambda: add_script_run_ctx(threading.current_thread(), ctx)
+
+conn = None if TAPE_MODE == "replay" else open_ledger(open_sheets=open_sheets)
+local_ledger = isinstance(conn, LocalLedgerStore)
+
+if local_ledger:
+    @st.cache_resource
+    def ledger_sync():
+        """프로세스 공유 백그라운드 동기화 (시트 → 로컬 저장소, 스냅샷 유지 시간마다)"""
+        return LedgerSync(open_sheets(), conn)
+
+    syncer = ledger_sync()
+    if conn.synced_at() is None:
+        with st.spinner("시트를 로컬 저장소로 동기화 중..."):
+            sync_ledger(syncer.source, conn, initializer=script_ctx_initializer())
+
+@st.cache_resource
+def last_snapshot():
+    """프로세스 공유: 직전 스냅샷 (만료 후 다시 만들 때 바뀌지 않은 시트는 이어받음)"""
+    return {}
+
+@st.cache_resource(ttl=SNAPSHOT_TTL, show_spinner="시트 불러오는 중...")
+def load_snapshot(ledger_version):
+    """시트 스냅샷 (시트 조회 워커 스레드에도 실행 컨텍스트 연결)
+    ledger_version: 로컬 저장소의 마지막 동기화 일시 (동기화되면 바로 새 스냅샷)"""
+    holder = last_snapshot()
+    holder["snapshot"] = build_snapshot(conn, initializer=script_ctx_initializer(), previous=holder.get("snapshot"))
+    return holder["snapshot"]
+
+with st.sidebar:
+    if st.button("지금 새로고침", use_container_width=True):
+        if local_ledger:
+            sync_ledger(syncer.source, conn, initializer=script_ctx_initializer())
+        load_snapshot.clear()
+    auto_refresh = st.checkbox(f"자동 새로고침 ({AUTO_REFRESH_INTERVAL}초)", key="auto_refresh",
+                               disabled=is_historical) and not is_historical
+    show_trace = st.checkbox("성능 디버그", key="show_trace")
+    if TAPE_MODE != "off":
+        st.caption(f"{'기록' if TAPE_MODE == 'record' else '재생'} 모드 · {TAPE_DIR}")
 
 
 # --- 데이터 불러오기 ---
 try:
-    # 입출금 시트
-    cash_df = conn.read(worksheet="입출금")
-    cash_df.columns = cash_df.columns.str.strip()
-    cash_df["거래일"] = pd.to_datetime(cash_df["거래일"])
-
-    # WRAP 시트에서 읽기
-    wrap_df = conn.read(worksheet="WRAP", usecols=[10, 12, 14], nrows=1, header=None)
-    wrap_capital_usd = float(wrap_df.iloc[0, 0]) if not wrap_df.empty else 0
-    wrap_value_usd   = float(wrap_df.iloc[0, 1]) if not wrap_df.empty else 0
-    exchange_rate_sheet = float(wrap_df.iloc[0, 2]) if not wrap_df.empty else 1450
-
-    if is_historical:
-        try:
-            start = ref_date - timedelta(days=10)
-            fx_data = fdr.DataReader("USD/KRW", start=start, end=ref_date)
-            exchange_rate = float(fx_data.iloc[-1]["Close"]) if not fx_data.empty else exchange_rate_sheet
-        except:
-            exchange_rate = exchange_rate_sheet
-    else:
-        exchange_rate = exchange_rate_sheet
-
-    # 각 계좌 시트 불러오기
-    TRADE_SHEET_NAMES = [name for name in ACCOUNT_NAMES if name not in ["LV"]]
-
-    trade_dfs = {
-        acct: conn.read(worksheet=acct)
-        for acct in TRADE_SHEET_NAMES
-    }
-    for acct, df in trade_dfs.items():
-        df.columns = df.columns.str.strip()
-
-        # ISA, Pension, 사주만 종목코드 특별 처리
-        if acct in ["ISA", "Pension", "사주"]:
-            df['종목코드'] = df['종목코드'].astype(str).str.split('.').str[0].str.zfill(6)
-
-        df["거래일"] = pd.to_datetime(df["거래일"])
-        df["제세금"] = pd.to_numeric(df["제세금"], errors="coerce").fillna(0)
-        df["단가"] = pd.to_numeric(df["단가"], errors="coerce").fillna(0)
-        df["수량"] = pd.to_numeric(df["수량"], errors="coerce").fillna(0)
-        df["거래금액"] = pd.to_numeric(df["거래금액"], errors="coerce").fillna(0)
-
-        # 유형 열이 있는 경우에만 처리
-        if "유형" in df.columns:
-            df["유형"] = df["유형"].fillna("미분류")
-        else:
-            df["유형"] = "미분류"
-
-    # 배당 시트 불러오기
-    df_dividend = conn.read(worksheet="배당")
-    df_dividend.columns = df_dividend.columns.str.strip()
-    df_dividend["배당금"] = pd.to_numeric(df_dividend["배당금"], errors="coerce").fillna(0).astype(int)
-
-
-    # 원화 환산
-    wrap_capital = wrap_capital_usd * exchange_rate
-    wrap_value = wrap_value_usd * exchange_rate
-
+    with trace.span("snapshot"):
+        snapshot = load_snapshot(conn.synced_at() if local_ledger else None)
 except Exception as e:
     st.error(f"엑셀 파일을 읽는 중 오류 발생: {e}")
     st.stop()
 
-# --- 계산 함수 정의 ---
-@st.cache_data(ttl=300)
-def get_price_data(code: str, source: str = "fdr"):
-    if source == "fdr":
-        return fdr.DataReader(code)
-    else:
-        return yf.download(code, period="5d")
-
-@st.cache_data(ttl=300)
-def get_all_prices(codes: tuple, us_codes: tuple, ref_date: pd.Timestamp = None) -> dict:
-    import concurrent.futures
-
-    def fetch(code):
-        try:
-            is_us = code in us_codes
-            is_past = ref_date and (pd.Timestamp(datetime.now().date()) - ref_date).days > 1
-
-            if is_us:
-                ticker = yf.Ticker(code)
-                if is_past:
-                    start = ref_date - timedelta(days=10)
-                    data = ticker.history(start=start, end=ref_date + timedelta(days=1))
-                else:
-                    data = ticker.history(period="5d")
-            else:
-                if is_past:
-                    start = ref_date - timedelta(days=10)
-                    data = fdr.DataReader(code, start=start, end=ref_date)
-                else:
-                    data = fdr.DataReader(code)
-
-            if data.empty:
-                return code, {"current": 0, "prev": 0}
-            current = float(data["Close"].iloc[-1])
-            prev = float(data["Close"].iloc[-2]) if len(data) >= 2 else current
-            return code, {"current": current, "prev": prev}
-        except:
-            return code, {"current": 0, "prev": 0}
-
-    with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-        results = executor.map(fetch, codes)
-
-    return dict(results)
-
-def calculate_account_summary(df_trade, df_cash, df_dividend, price_map, is_us_stock=False):
-    summary_list = []
-    realized_total = 0
-    today_profit = 0
-
-    for code, group in df_trade.groupby("종목코드"):
-        group = group.sort_values("거래일").copy()
-        name = group["종목명"].iloc[0]
-        asset_type = group["유형"].iloc[0]
-
-        avg_price = 0
-        hold_qty = 0
-        realized_profit = 0
-
-        for _, row in group.iterrows():
-            qty = row["수량"]
-            price = row["단가"]
-            fee = row["제세금"]
-            amt = row["거래금액"]
-
-            if row["구분"] == "매수":
-                total_cost = avg_price * hold_qty + amt + fee
-                hold_qty += qty
-                avg_price = total_cost / hold_qty if hold_qty != 0 else 0
-            else:
-                profit = (price - avg_price) * qty - fee
-                realized_profit += profit
-                hold_qty -= qty
-
-        if hold_qty > 0:
-            try:
-                if str(code) == "펀드" or (str(code).endswith(".KS") and price_map.get(str(code), {}).get("current", 0) == 0):
-                    current_price = group["현재가"].dropna().iloc[-1] if "현재가" in group.columns else 0
-                    prev_close = current_price
-                else:
-                    price_info = price_map.get(str(code), {"current": 0, "prev": 0})
-                    current_price = price_info["current"]
-                    prev_close = price_info["prev"]
-            except:
-                current_price = 0
-                prev_close = 0
-
-            current_value = current_price * hold_qty
-            buy_cost = avg_price * hold_qty
-            profit = current_value - buy_cost
-            profit_rate = profit / buy_cost * 100 if buy_cost else 0
-            today_profit += (current_price - prev_close) * hold_qty 
-
-            summary_list.append({
-                "종목코드": code,
-                "종목명": name,
-                "유형": asset_type,
-                "보유수량": hold_qty,
-                "평균단가": round(avg_price),
-                "현재가": round(current_price),
-                "평가금액": round(current_value),
-                "매입금액": round(buy_cost),
-                "평가손익": round(profit),
-                "수익률(%)": round(profit_rate, 2)
-            })
-
-        realized_total += realized_profit
-
-    df_summary = pd.DataFrame(summary_list)
-
-    # 배당금 계산 - NaN 처리 추가
-    dividend_total = 0
-    if not df_trade.empty and "계좌명" in df_trade.columns:
-        account_names = df_trade["계좌명"].unique()
-        dividend_sum = df_dividend[df_dividend["계좌명"].isin(account_names)]["배당금"].sum()
-        dividend_total = dividend_sum if pd.notna(dividend_sum) else 0
-
-    # 빈 DataFrame 처리
-    if df_summary.empty:
-        current_value = 0
-        current_profit = 0
-    else:
-        current_value = df_summary["평가금액"].sum()
-        current_profit = df_summary["평가손익"].sum()
-
-    # 계산된 값들의 NaN 처리
-    capital = (df_cash[df_cash["구분"] == "입금"]["금액"].sum() - df_cash[df_cash["구분"] == "출금"]["금액"].sum())
-    capital = capital if pd.notna(capital) else 0
-    
-    actual_profit = realized_total + dividend_total
-    actual_profit = actual_profit if pd.notna(actual_profit) else 0
-    
-    total_balance = capital + current_profit + actual_profit
-    cash = total_balance - current_value
-    total_profit_rate = (total_balance - capital) / capital * 100 if capital else 0
-
-    summary = {
-        "capital": round(capital) if pd.notna(capital) else 0,
-        "current_value": round(current_value) if pd.notna(current_value) else 0,
-        "current_profit": round(current_profit) if pd.notna(current_profit) else 0,
-        "actual_profit": round(actual_profit) if pd.notna(actual_profit) else 0,
-        "total_balance": round(total_balance) if pd.notna(total_balance) else 0,
-        "cash": round(cash) if pd.notna(cash) else 0,
-        "total_profit": round(current_profit + actual_profit + dividend_total) if pd.notna(current_profit + actual_profit + dividend_total) else 0,
-        "total_profit_rate": round(total_profit_rate, 2) if pd.notna(total_profit_rate) else 0,
-        "today_profit": round(today_profit) if pd.notna(today_profit) else 0
-    }
-
-    return df_summary, summary
-
-def calculate_strategy_summary(df_trade, df_cash, df_dividend_filtered, is_us_stock=False):
-    """성과 탭 전용: 이미 필터링된 배당금을 사용"""
-    summary_list = []
-    realized_total = 0
-    today_profit = 0
-
-    for code, group in df_trade.groupby("종목코드"):
-        group = group.sort_values("거래일").copy()
-        name = group["종목명"].iloc[0]
-        asset_type = group["유형"].iloc[0]
-
-        avg_price = 0
-        hold_qty = 0
-        realized_profit = 0
-
-        for _, row in group.iterrows():
-            qty = row["수량"]
-            price = row["단가"]
-            fee = row["제세금"]
-            amt = row["거래금액"]
-
-            if row["구분"] == "매수":
-                total_cost = avg_price * hold_qty + amt + fee
-                hold_qty += qty
-                avg_price = total_cost / hold_qty if hold_qty != 0 else 0
-            else:
-                profit = (price - avg_price) * qty - fee
-                realized_profit += profit
-                hold_qty -= qty
-
-        if hold_qty > 0:
-            try:
-                if str(code) == "펀드":
-                    current_price = group["현재가"].dropna().iloc[-1] if "현재가" in group.columns else 0
-                    prev_close = current_price
-                else:
-                    price_info = price_map.get(str(code), {"current": 0, "prev": 0})
-                    current_price = price_info["current"]
-                    prev_close = price_info["prev"]
-            except:
-                current_price = 0
-                prev_close = 0
-
-            current_value = current_price * hold_qty
-            buy_cost = avg_price * hold_qty
-            profit = current_value - buy_cost
-            profit_rate = profit / buy_cost * 100 if buy_cost else 0
-            today_profit += (current_price - prev_close) * hold_qty 
-
-            summary_list.append({
-                "종목코드": code,
-                "종목명": name,
-                "유형": asset_type,
-                "보유수량": hold_qty,
-                "평균단가": round(avg_price),
-                "현재가": round(current_price),
-                "평가금액": round(current_value),
-                "매입금액": round(buy_cost),
-                "평가손익": round(profit),
-                "수익률(%)": round(profit_rate, 2)
-            })
-
-        realized_total += realized_profit
-
-    df_summary = pd.DataFrame(summary_list)
-
-    dividend_total = 0
-    if not df_dividend_filtered.empty:
-        dividend_sum = df_dividend_filtered["배당금"].sum()
-        dividend_total = dividend_sum if pd.notna(dividend_sum) else 0
-
-    if df_summary.empty:
-        current_value = 0
-        current_profit = 0
-    else:
-        current_value = df_summary["평가금액"].sum()
-        current_profit = df_summary["평가손익"].sum()
-
-    capital = (df_cash[df_cash["구분"] == "입금"]["금액"].sum() - df_cash[df_cash["구분"] == "출금"]["금액"].sum())
-    capital = capital if pd.notna(capital) else 0
-    
-    actual_profit = realized_total + dividend_total
-    actual_profit = actual_profit if pd.notna(actual_profit) else 0
-    
-    total_balance = capital + current_profit + actual_profit
-    cash = total_balance - current_value
-    total_profit_rate = (total_balance - capital) / capital * 100 if capital else 0
-
-    summary = {
-        "capital": round(capital) if pd.notna(capital) else 0,
-        "current_value": round(current_value) if pd.notna(current_value) else 0,
-        "current_profit": round(current_profit) if pd.notna(current_profit) else 0,
-        "actual_profit": round(actual_profit) if pd.notna(actual_profit) else 0,
-        "total_balance": round(total_balance) if pd.notna(total_balance) else 0,
-        "cash": round(cash) if pd.notna(cash) else 0,
-        "total_profit": round(current_profit + actual_profit + dividend_total) if pd.notna(current_profit + actual_profit + dividend_total) else 0,
-        "total_profit_rate": round(total_profit_rate, 2) if pd.notna(total_profit_rate) else 0,
-        "today_profit": round(today_profit) if pd.notna(today_profit) else 0
-    }
-
-    return df_summary, summary
-
+if snapshot.loaded_at < trace.started_at:
+    trace.count("snapshot", "hit")
+else:
+    trace.count("snapshot", "miss")
+    for name, seconds in snapshot.sheet_timings.items():
+        trace.fetch([name], LEDGER_BACKEND.split(":")[0], seconds, not isinstance(snapshot.optional_sheets.get(name), Exception))
+
+with st.sidebar:
+    st.caption(f"스냅샷 {snapshot.loaded_at:%Y-%m-%d %H:%M:%S} (유지 {SNAPSHOT_TTL // 60}분)")
+    if local_ledger:
+        st.caption(f"로컬 원장 {conn.synced_at():%H:%M:%S} 동기화 (주기 {syncer.interval // 60}분)")
+        if isinstance(syncer.last_result, Exception):
+            st.caption(f"원장 동기화 실패 – 마지막 사본 사용: {syncer.last_result}")
+    with st.expander("시트 로딩 시간"):
+        st.dataframe(
+            pd.Series(snapshot.sheet_timings, name="초").sort_values(ascending=False).round(2),
+            use_container_width=True,
+        )
 
 # --- 스타일 정의 ---
 st.markdown("""
@@ -572,132 +364,80 @@ ACCOUNT_COLORS = {
     "US": "#F7B7A3",
 }
 
+STRATEGY_COLORS = {
+    "US Market Index": "#412f95",
+    "US AI Power & Grid": "#7875f4",
+    "US Managed WRAP": "#ffb601",
+    "KR Index Leverage": "#ff7f05",
+    "KR Sector ETFs": "#ff76a6",
+}
+
 theme_color = ACCOUNT_COLORS.get(selected_tab, "#EDEDE9")
 
 acct = selected_tab
 currency_symbol = "$ " if selected_tab == "US" else ""
 
-# 전체 종목코드 수집
-all_codes = set()
-us_codes = set()  # 추가
-for acct_name in ["ISA", "Pension", "IRP", "ETF", "US"]:
-    df_t = trade_dfs[acct_name]
-    codes = df_t["종목코드"].astype(str).unique()
-    all_codes.update(codes)
-    if acct_name == "US":
-        us_codes.update(codes)  # 추가
-all_codes.discard("펀드")
-us_codes.discard("펀드")
-
-# 기준일 필터링
-if is_historical:
-    cash_df = cash_df[cash_df["거래일"] <= ref_date]
-    for acct_name in TRADE_SHEET_NAMES:
-        trade_dfs[acct_name] = trade_dfs[acct_name][
-            trade_dfs[acct_name]["거래일"] <= ref_date
-        ]
-    df_dividend = df_dividend[pd.to_datetime(df_dividend["배당일"]) <= ref_date] \
-        if "배당일" in df_dividend.columns else df_dividend
-
-# 한 번에 병렬 조회
-price_map = get_all_prices(tuple(all_codes), tuple(us_codes), ref_date=ref_date if is_historical else None)
-
-local_accounts = ["ISA", "Pension", "IRP", "ETF"]
-local_total_summary = {
-    "capital": 0,
-    "current_value": 0,
-    "current_profit": 0,
-    "actual_profit": 0,
-    "total_balance": 0,
-    "cash": 0,
-    "today_profit": 0,
+# 계산 입력: 기준일 슬라이스, 시세(현재가는 백그라운드 갱신 표에서 읽기), 환율
+inputs = prepare_inputs(snapshot, ref_date, is_historical, live=True)
+cash_df = inputs.cash_df
+price_map = inputs.price_map
+exchange_rate = inputs.exchange_rate
+
+stale_codes = sorted(code for code, quote in price_map.items() if quote["stale"])
+if stale_codes:
+    st.caption(f"시세 갱신 지연 – 마지막 저장 시세 사용: {', '.join(stale_codes)}")
+
+# 시세 나이: 종목별 마지막 갱신 일시 (갱신 이력 없으면 빈 값)
+if not is_historical:
+    quote_ages = pd.Series({
+        code: (datetime.now() - quote["fetched_at"]).total_seconds() if quote["fetched_at"] else None
+        for code, quote in price_map.items()
+    }, name="초", dtype="float64")
+    with st.sidebar:
+        if quote_ages.notna().any():
+            st.caption(f"시세 {quote_ages.max() // 60:.0f}분 전 갱신 (가장 오래된 종목, 주기 {QUOTE_REFRESH_INTERVAL // 60}분)")
+        with st.expander("시세 갱신 경과"):
+            st.dataframe(quote_ages.sort_values(ascending=False).round(0), use_container_width=True)
+
+# 탭별 필요 결과
+TAB_REQUIREMENTS = {
+    "성과": ["local_total", "summary:US", "strategies"],
+    "전체": ["local_total"],
+    **{name: [f"summary:{name}"] for name in LOCAL_ACCOUNTS + ["US"]},
+    "US": ["summary:US", "fx_split:US"],
 }
-df_summary_list = []
-
-for acct_name in local_accounts:
-    df_trade = trade_dfs[acct_name]
-    df_cash = cash_df[cash_df["계좌명"] == acct_name]
-    df_s, s = calculate_account_summary(df_trade, df_cash, df_dividend, price_map)
-    df_summary_list.append(df_s)
-    for key in local_total_summary:
-        local_total_summary[key] += s[key]
-
-local_total_summary["total_profit_rate"] = (
-    (local_total_summary["total_balance"] - local_total_summary["capital"]) / local_total_summary["capital"] * 100
-    if local_total_summary["capital"] else 0
-)
 
-local_summary = {k: round(v) if k != "total_profit_rate" else round(v, 2) for k, v in local_total_summary.items()}
-local_total_summary["total_profit"] = local_total_summary["current_profit"] + local_total_summary["actual_profit"]
+# 계산 결과 메모: 스냅샷 시각, 기준일, 환율, 시세 중 하나라도 바뀌면 초기화
+compute_key = inputs.key
+memo_key, compute_memo = st.session_state.get("compute_memo", (None, None))
+if memo_key != compute_key:
+    compute_memo = {}
+    st.session_state["compute_memo"] = (compute_key, compute_memo)
+
+graph = PortfolioGraph(inputs, compute_memo)
+compute = graph.compute
+results = {name: compute(name) for name in TAB_REQUIREMENTS[acct]}
+
+@st.cache_data(ttl=SNAPSHOT_TTL, show_spinner="일별 평가액 계산 중...")
+def cached_nav_report(snapshot_loaded_at, start, end, _snapshot, codes, us_codes, fallback_rate):
+    """기간 [start, end]의 계좌별·전략별 일별 시계열 (스냅샷·기간별 캐시)"""
+    return nav_report(_snapshot, start, end, codes, us_codes, fallback_rate)
 
 if acct == "전체":
-    df_summary = pd.concat(df_summary_list, ignore_index=True)
-    summary = local_summary
+    df_summary, summary = results["local_total"]
 
 elif acct == "성과":
     df_summary = pd.DataFrame()
-    summary = local_summary
-
-else:
-    df_trade = trade_dfs[acct]
-    df_cash = cash_df[cash_df["계좌명"] == acct]
-    df_summary, summary = calculate_account_summary(df_trade, df_cash, df_dividend, price_map)
-
-
-total_profit = summary["current_profit"] + summary["actual_profit"]
-total_profit_rate = summary["total_profit_rate"]
-today_profit = summary["today_profit"] 
-
-current_profit = summary["current_profit"]
+    summary = results["local_total"][1]
 
-if df_summary.empty:
-    buy_cost_total = 0
-    current_profit_rate = 0
 else:
-    buy_cost_total = df_summary["매입금액"].sum()
-    current_profit_rate = current_profit / buy_cost_total * 100 if buy_cost_total > 0 else 0
-
-actual_profit = summary["actual_profit"]
-actual_profit_rate = actual_profit / summary["capital"] * 100 if summary["capital"] else 0
-
-current_value = summary["current_value"]
-cash = summary["cash"]
-capital = summary["capital"]
-operated_ratio = current_value / summary["total_balance"] * 100 if summary["total_balance"] != 0 else 0
-cash_ratio = cash / summary["total_balance"] * 100 if summary["total_balance"] != 0 else 0
-capital_ratio = capital / summary["total_balance"] * 100 if summary["total_balance"] != 0 else 0
+    df_summary, summary = results[f"summary:{acct}"]
 
 # --- 레이아웃 시작 ---
     
 icon_book = "https://cdn-icons-png.flaticon.com/128/16542/16542648.png"
 icon_wallet = "https://cdn-icons-png.flaticon.com/128/19011/19011999.png"
 
-card_html_profit = f"""
-<div class="card">
-    <div class="card-title"><span style= "color: {theme_color}";>●</span><span style="margin-left: 6px;">Total Profit</span></div>
-    <div class="card-value">{currency_symbol}{total_profit:,.0f}</div>
-    <div class="badge">+{total_profit_rate:.2f}%</div>
-    <div style="display:flex; justify-content:space-between; margin-top: 15px; ">
-        <div class="card-item" style="width: 47%; background: {theme_color};">
-            <div style="display: flex; align-items: center; gap: 6px;">
-                <img src="{icon_book}" width="20" height="20" />          
-                <span class="item-label" >Current</span>
-            </div>
-            <div class="item-return" >{currency_symbol}{current_profit:,.0f}</div>
-            <div class="badge">+{current_profit_rate:.2f}%</div>
-        </div>
-        <div class="card-item" style="width: 47%;">
-            <div style="display: flex; align-items: center; gap: 6px;">
-                <img src="{icon_wallet}" width="20" height="20" />
-                <span class="item-label">Actual</span>
-            </div>
-            <div class="item-return">{currency_symbol}{actual_profit:,.0f}</div>
-            <div class="badge">+{actual_profit_rate:.2f}%</div>
-        </div>
-    </div>
-</div>
-"""
-
 def get_bar(percent, color="#2E7850"):
     return f"<div style='width:100%; background:#F5F5F5; height:20px; border-radius:5px; margin-top:8px; margin-bottom:12px;'><div style='width:{percent:.1f}%; background:{color}; height:20px; border-radius:5px;'></div></div>"
 
@@ -726,8 +466,6 @@ paid_amount = deposit_df["금액"].sum()
 remaining_amount = max(limit - paid_amount, 0)
 paid_ratio = (paid_amount / limit) * 100 if limit > 0 else 0
 
-bar1 = get_bar(operated_ratio, color=theme_color)
-
 if acct in ["ISA", "Pension", "IRP"] and limit > 0:
     bar2_html = get_bar(paid_ratio, color=theme_color)
     limit_html = f"""
@@ -748,7 +486,59 @@ else:
 icon_capital = "https://cdn-icons-png.flaticon.com/128/7928/7928113.png"
 icon_cash = "https://cdn-icons-png.flaticon.com/128/13794/13794238.png"
 
-card_html_balance = f"""
+def build_account_cards(df_summary, summary):
+    """계좌 탭 카드 HTML (Total Profit, Balance, Holdings): 시세가 바뀌면 이것만 다시 만듦"""
+    total_profit = summary["current_profit"] + summary["actual_profit"]
+    total_profit_rate = summary["total_profit_rate"]
+    today_profit = summary["today_profit"] 
+
+    current_profit = summary["current_profit"]
+
+    if df_summary.empty:
+        buy_cost_total = 0
+        current_profit_rate = 0
+    else:
+        buy_cost_total = df_summary["매입금액"].sum()
+        current_profit_rate = current_profit / buy_cost_total * 100 if buy_cost_total > 0 else 0
+
+    actual_profit = summary["actual_profit"]
+    actual_profit_rate = actual_profit / summary["capital"] * 100 if summary["capital"] else 0
+
+    current_value = summary["current_value"]
+    cash = summary["cash"]
+    capital = summary["capital"]
+    operated_ratio = current_value / summary["total_balance"] * 100 if summary["total_balance"] != 0 else 0
+    cash_ratio = cash / summary["total_balance"] * 100 if summary["total_balance"] != 0 else 0
+
+    card_html_profit = f"""
+<div class="card">
+    <div class="card-title"><span style= "color: {theme_color}";>●</span><span style="margin-left: 6px;">Total Profit</span></div>
+    <div class="card-value">{currency_symbol}{total_profit:,.0f}</div>
+    <div class="badge">+{total_profit_rate:.2f}%</div>
+    <div style="display:flex; justify-content:space-between; margin-top: 15px; ">
+        <div class="card-item" style="width: 47%; background: {theme_color};">
+            <div style="display: flex; align-items: center; gap: 6px;">
+                <img src="{icon_book}" width="20" height="20" />          
+                <span class="item-label" >Current</span>
+            </div>
+            <div class="item-return" >{currency_symbol}{current_profit:,.0f}</div>
+            <div class="badge">+{current_profit_rate:.2f}%</div>
+        </div>
+        <div class="card-item" style="width: 47%;">
+            <div style="display: flex; align-items: center; gap: 6px;">
+                <img src="{icon_wallet}" width="20" height="20" />
+                <span class="item-label">Actual</span>
+            </div>
+            <div class="item-return">{currency_symbol}{actual_profit:,.0f}</div>
+            <div class="badge">+{actual_profit_rate:.2f}%</div>
+        </div>
+    </div>
+</div>
+"""
+
+    bar1 = get_bar(operated_ratio, color=theme_color)
+
+    card_html_balance = f"""
 <div class="card">
     <div class="card-title"><span style="color:{theme_color};">●</span><span style="margin-left:6px;">Balance</span></div>
     <div class="card-value">{currency_symbol}{summary['total_balance']:,.0f}</div>
@@ -784,13 +574,44 @@ card_html_balance = f"""
         {limit_html}
 </div>
 """.strip()
+
+    with trace.span("html:holdings"):
+        card_html_stock = build_holdings_card(df_summary, selected_tab, theme_color, currency_symbol, current_value, today_profit, current_profit)
+
+    return card_html_profit, card_html_balance, card_html_stock
     
 icon_today = "https://cdn-icons-png.flaticon.com/128/876/876754.png"
 icon_total = "https://cdn-icons-png.flaticon.com/128/13110/13110858.png"
 
-today_profit_plus = f"{today_profit:,.0f}" if today_profit > 0 else "&nbsp;"
+# --- HTML 조각 캐시: 같은 내용의 행은 재실행 간에도 한 번만 렌더 ---
+HTML_FRAGMENT_LIMIT = 5000  # 초과 시 비우고 다시 채움
+
+@st.cache_resource
+def html_fragments():
+    """프로세스 공유: (조각 종류, 내용 값) → HTML"""
+    return {}
+
+def cached_fragment(render, *values):
+    fragments = html_fragments()
+    key = (render.__name__, values)
+    html = fragments.get(key)
+    trace.count("html_fragment", "miss" if html is None else "hit")
+    if html is None:
+        if len(fragments) >= HTML_FRAGMENT_LIMIT:
+            fragments.clear()
+        html = fragments[key] = render(*values)
+    return html
 
-card_html_stock = dedent(f"""
+def icon_up(size=16, color=green_color):
+    return f"""<svg xmlns="http://www.w3.org/2000/svg" width="{size}" height="{size}" fill="none" stroke="{color}" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><circle cx="12" cy="12" r="10"/><path d="M12 16V8"/><path d="m8 12 4-4 4 4"/></svg>"""
+
+def icon_down(size=16, color=red_color):
+    return f"""<svg xmlns="http://www.w3.org/2000/svg" width="{size}" height="{size}" fill="none" stroke="{color}" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><circle cx="12" cy="12" r="10"/><path d="M12 8v8"/><path d="m8 12 4 4 4-4"/></svg>"""
+
+def holdings_header_html(theme_color, currency_symbol, current_value, today_profit, current_profit):
+    today_profit_plus = f"{today_profit:,.0f}" if today_profit > 0 else "&nbsp;"
+
+    return dedent(f"""
 <div class="card">
     <div class="card-title"><span style= "color: {theme_color}";>●</span><span style="margin-left: 6px;">Holdings</span></div>
     <div class="card-value" style="display: flex; justify-content: space-between; align-items: center;">
@@ -816,26 +637,10 @@ card_html_stock = dedent(f"""
     </div>
 """).strip()
 
-def icon_up(size=16, color=green_color):
-    return f"""<svg xmlns="http://www.w3.org/2000/svg" width="{size}" height="{size}" fill="none" stroke="{color}" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><circle cx="12" cy="12" r="10"/><path d="M12 16V8"/><path d="m8 12 4-4 4 4"/></svg>"""
+def holding_row_html(name, qty, current_price, avg_price, stock_value, purchase_value, profit, profit_rate, currency_symbol):
+    icon_html = icon_up(size=24) if profit >=0 else icon_down(size=24)
 
-def icon_down(size=16, color=red_color):
-    return f"""<svg xmlns="http://www.w3.org/2000/svg" width="{size}" height="{size}" fill="none" stroke="{color}" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><circle cx="12" cy="12" r="10"/><path d="M12 8v8"/><path d="m8 12 4 4 4-4"/></svg>"""
-
-if not df_summary.empty:
-    for _, row in df_summary.sort_values("평가금액", ascending=False).iterrows():
-        name = row["종목명"]
-        profit = row["평가손익"]
-        profit_rate = row["수익률(%)"]
-        stock_value = row["평가금액"]
-        purchase_value = row["매입금액"]
-        qty = row["보유수량"]
-        avg_price = row["평균단가"]
-        current_price = row["현재가"]
-
-        icon_html = icon_up(size=24) if profit >=0 else icon_down(size=24)
-
-        card_html_stock += dedent(f"""
+    return dedent(f"""
         <div class="stock-item" style="display: flex; justify-content: space-between; align-items: center; margin-bottom:10px;">
             <div style="flex: 3.2; display: flex; align-items: center; gap: 10px; min-width: 0;" >
                 {icon_html}
@@ -872,65 +677,79 @@ if not df_summary.empty:
             </div>
         </div>
         """)
-else:
-    card_html_stock += """
+
+def build_holdings_card(df_summary, selected_tab, theme_color, currency_symbol, current_value, today_profit, current_profit):
+    """Holdings 카드: 요약 + 종목별 행 (+ IRP 비중 막대)
+    행 조각은 내용 값 기준으로 캐시, 조각 목록을 한 번에 결합"""
+    parts = [cached_fragment(holdings_header_html, theme_color, currency_symbol, current_value, today_profit, current_profit)]
+
+    if not df_summary.empty:
+        rows = df_summary.sort_values("평가금액", ascending=False)
+        parts.extend(
+            cached_fragment(holding_row_html, *values, currency_symbol)
+            for values in zip(
+                rows["종목명"].tolist(), rows["보유수량"].tolist(), rows["현재가"].tolist(), rows["평균단가"].tolist(),
+                rows["평가금액"].tolist(), rows["매입금액"].tolist(), rows["평가손익"].tolist(), rows["수익률(%)"].tolist(),
+            )
+        )
+    else:
+        parts.append("""
     <div style="text-align: center; padding: 40px; color: #999; font-size: 18px;">
         보유중인 종목이 없습니다
     </div>
-    """
+    """)
 
-if selected_tab == "IRP":
-    df_summary_sorted = df_summary.sort_values("평가금액", ascending=False).copy()
+    if selected_tab == "IRP":
+        df_summary_sorted = df_summary.sort_values("평가금액", ascending=False).copy()
     
-    tdf_mask = df_summary_sorted["종목명"].str.contains("KB온국민TDF2055|TIGER TDF2045", na=False)
+        tdf_mask = df_summary_sorted["종목명"].str.contains("KB온국민TDF2055|TIGER TDF2045", na=False)
     
-    if tdf_mask.any():
-        tdf_rows = df_summary_sorted[tdf_mask]
-        tdf_total_value = tdf_rows["평가금액"].sum()
+        if tdf_mask.any():
+            tdf_rows = df_summary_sorted[tdf_mask]
+            tdf_total_value = tdf_rows["평가금액"].sum()
         
-        df_summary_sorted = df_summary_sorted[~tdf_mask].copy()
+            df_summary_sorted = df_summary_sorted[~tdf_mask].copy()
         
-        tdf_combined_row = pd.DataFrame({
-            "종목코드": ["TDF"],
-            "종목명": ["TDF(안전자산)"],
-            "보유수량": [0],
-            "평균단가": [0],
-            "현재가": [0],
-            "평가금액": [tdf_total_value],
-            "매입금액": [tdf_rows["매입금액"].sum()],
-            "평가손익": [tdf_rows["평가손익"].sum()],
-            "수익률(%)": [0]
-        })
+            tdf_combined_row = pd.DataFrame({
+                "종목코드": ["TDF"],
+                "종목명": ["TDF(안전자산)"],
+                "보유수량": [0],
+                "평균단가": [0],
+                "현재가": [0],
+                "평가금액": [tdf_total_value],
+                "매입금액": [tdf_rows["매입금액"].sum()],
+                "평가손익": [tdf_rows["평가손익"].sum()],
+                "수익률(%)": [0]
+            })
         
-        df_summary_sorted = pd.concat([df_summary_sorted, tdf_combined_row], ignore_index=True)
-        df_summary_sorted = df_summary_sorted.sort_values("평가금액", ascending=False)
+            df_summary_sorted = pd.concat([df_summary_sorted, tdf_combined_row], ignore_index=True)
+            df_summary_sorted = df_summary_sorted.sort_values("평가금액", ascending=False)
     
-    df_summary_sorted["비중"] = df_summary_sorted["평가금액"] / df_summary_sorted["평가금액"].sum() * 100
-
-    color_list = ["#375534", "#6B9071", "#aec3b0", "#e3eed4", "#6D6875"]
-    total_eval = df_summary_sorted["평가금액"].sum()
-    df_summary_sorted["color"] = [color_list[i % len(color_list)] for i in range(len(df_summary_sorted))]
-
-    bar_segments = ""
-    for i, row in df_summary_sorted.iterrows():
-        percent = row["비중"]
-        color = row["color"]
-        bar_segments += f'<div style="width:{percent:.2f}%; background-color:{color};"></div>'
-
-    legend_html = ""
-    for i, row in df_summary_sorted.iterrows():
-        name = row["종목명"]
-        percent = row["비중"]
-        color = row["color"]
-        legend_html += (
-            f'<div style="display:flex; align-items:center; margin-right:16px; margin-bottom:4px;">'
-            f'<div style="width:12px; height:12px; background-color:{color}; border-radius:3px; margin-right:6px;"></div>'
-            f'<div style="font-size:14px; color:#666;">{name}</div>'
-            f'<div style="font-size:14px; color:#444; margin-left:6px;">{percent:.0f}%</div>'
-            f'</div>'
-        )
-
-    card_html_stock += dedent(f"""
+        df_summary_sorted["비중"] = df_summary_sorted["평가금액"] / df_summary_sorted["평가금액"].sum() * 100
+
+        color_list = ["#375534", "#6B9071", "#aec3b0", "#e3eed4", "#6D6875"]
+        df_summary_sorted["color"] = [color_list[i % len(color_list)] for i in range(len(df_summary_sorted))]
+
+        bar_segments = ""
+        for i, row in df_summary_sorted.iterrows():
+            percent = row["비중"]
+            color = row["color"]
+            bar_segments += f'<div style="width:{percent:.2f}%; background-color:{color};"></div>'
+
+        legend_html = ""
+        for i, row in df_summary_sorted.iterrows():
+            name = row["종목명"]
+            percent = row["비중"]
+            color = row["color"]
+            legend_html += (
+                f'<div style="display:flex; align-items:center; margin-right:16px; margin-bottom:4px;">'
+                f'<div style="width:12px; height:12px; background-color:{color}; border-radius:3px; margin-right:6px;"></div>'
+                f'<div style="font-size:14px; color:#666;">{name}</div>'
+                f'<div style="font-size:14px; color:#444; margin-left:6px;">{percent:.0f}%</div>'
+                f'</div>'
+            )
+
+        parts.append(dedent(f"""
         <div class="card-item" style="background: white;">
                 <div style="display:flex; height:24px; border-radius:8px; overflow:hidden; margin-top:12px; margin-bottom:12px;">
                     {bar_segments}
@@ -939,9 +758,11 @@ if selected_tab == "IRP":
                     {legend_html}
                 </div>
             </div>
-    """).strip()
+    """).strip())
+
+    parts.append("</div>")
 
-card_html_stock += "</div>"
+    return "".join(parts)
 
 
 # ========================================
@@ -951,202 +772,8 @@ card_html_stock += "</div>"
 def clean_html(html_string):
     return ''.join(line.strip() for line in html_string.splitlines())
 
-if selected_tab == "성과":
-    
-    def calculate_strategy_by_type(type_filter, exchange_rate):
-        value = 0
-        current_profit = 0
-        actual_profit = 0
-        buy_cost = 0
-        
-        for acct_name in ["ISA", "Pension", "IRP", "US"]:
-            df_trade = trade_dfs[acct_name]
-            df_cash = cash_df[cash_df["계좌명"] == acct_name]
-            
-            if isinstance(type_filter, list):
-                mask = df_trade["유형"].isin(type_filter)
-                dividend_mask = df_dividend["유형"].isin(type_filter)
-            else:
-                mask = df_trade["유형"] == type_filter
-                dividend_mask = df_dividend["유형"] == type_filter
-            
-            df_filtered = df_trade[mask]
-            
-            dividend_filtered = df_dividend[
-                (df_dividend["계좌명"] == acct_name) & dividend_mask
-            ]
-            
-            if not df_filtered.empty:
-                df_s, s = calculate_strategy_summary(df_filtered, df_cash, dividend_filtered, is_us_stock=(acct_name == "US"))
-                if not df_s.empty:
-                    multiplier = exchange_rate if acct_name == "US" else 1
-                    value += df_s["평가금액"].sum() * multiplier
-                    current_profit += df_s["평가손익"].sum() * multiplier
-                    buy_cost += df_s["매입금액"].sum() * multiplier
-                    actual_profit += s["actual_profit"] * multiplier
-        
-        profit = current_profit + actual_profit
-        return_rate = (profit / buy_cost * 100) if buy_cost > 0 else 0
-        
-        return {
-            "value": int(value),
-            "current_profit": int(current_profit),
-            "actual_profit": int(actual_profit),
-            "buy_cost": int(buy_cost),
-            "profit": int(profit),
-            "return": round(return_rate, 1)
-        }
-    
-    strategy_1 = calculate_strategy_by_type(["S&P", "나스닥", "TDF"], exchange_rate)
-
-    us_market_value = strategy_1["value"]
-    us_market_profit = strategy_1["profit"]
-    us_market_return = strategy_1["return"]
-
-    strategy_2 = calculate_strategy_by_type("전력", exchange_rate)
-
-    us_ai_value = strategy_2["value"]
-    us_ai_profit = strategy_2["profit"]
-    us_ai_return = strategy_2["return"]
-    
-    wrap_value = wrap_value_usd * exchange_rate
-    wrap_profit = (wrap_value_usd - wrap_capital_usd) * exchange_rate
-    wrap_return = ((wrap_value_usd - wrap_capital_usd) / wrap_capital_usd * 100) if wrap_capital_usd > 0 else 0
-    
-    try:
-        lv_df = conn.read(worksheet="LV")
-        lv_df.columns = lv_df.columns.str.strip()
-        lv_df["거래일"] = pd.to_datetime(lv_df["거래일"])
-        if is_historical:
-            lv_df = lv_df[lv_df["거래일"] <= ref_date]
-        lv_profit = pd.to_numeric(lv_df["손익"], errors="coerce").sum()
-
-        lv_capital = 10000000
-        lv_value = lv_profit + lv_capital
-        lv_return = (lv_profit / lv_capital * 100) if lv_capital > 0 else 0
-    except Exception as e:
-        st.warning(f"LV 데이터 로드 실패: {e}")
-        lv_value = 0
-        lv_profit = 0
-        lv_return = 0
-    
-    df_trade_etf = trade_dfs["ETF"]
-    df_cash_etf = cash_df[cash_df["계좌명"] == "ETF"]
-    df_s_etf, s_etf = calculate_account_summary(df_trade_etf, df_cash_etf, df_dividend, price_map)
-    
-    etf_value = s_etf["current_value"]
-    etf_profit = s_etf["current_profit"] + s_etf["actual_profit"]
-    etf_return = s_etf["total_profit_rate"]
- 
-    strategies = [
-        {"name": "US Market Index",    "value": int(us_market_value), "profit": int(us_market_profit), "rate": round(us_market_return, 1), "color": "#412f95", "current_profit": int(strategy_1["current_profit"]), "actual_profit": int(strategy_1["actual_profit"])},
-        {"name": "US AI Power & Grid", "value": int(us_ai_value),     "profit": int(us_ai_profit),     "rate": round(us_ai_return, 1),    "color": "#7875f4", "current_profit": int(strategy_2["current_profit"]), "actual_profit": int(strategy_2["actual_profit"])},
-        {"name": "US Managed WRAP",    "value": int(wrap_value),      "profit": int(wrap_profit),      "rate": round(wrap_return, 1),     "color": "#ffb601", "current_profit": int(wrap_profit), "actual_profit": 0},
-        {"name": "KR Index Leverage",  "value": int(lv_value),        "profit": int(lv_profit),        "rate": round(lv_return, 1),       "color": "#ff7f05", "current_profit": 0,   "actual_profit": int(lv_profit)},
-        {"name": "KR Sector ETFs",     "value": int(etf_value),       "profit": int(etf_profit),       "rate": round(etf_return, 1),      "color": "#ff76a6", "current_profit": int(s_etf["current_profit"]), "actual_profit": int(s_etf["actual_profit"])},
-    ]
-    
-    total_strategy_value = sum(s["value"] for s in strategies)
-    total_strategy_profit = sum(s["profit"] for s in strategies)
-    total_strategy_current_profit = sum(s["current_profit"] for s in strategies)  
-    total_strategy_actual_profit = sum(s["actual_profit"] for s in strategies)    
-    
-    for strategy in strategies:
-        strategy["weight"] = round((strategy["value"] / total_strategy_value * 100), 1) if total_strategy_value > 0 else 0
-    
-    total_portfolio_value = total_strategy_value
-    total_profit_ov = total_strategy_profit
-    total_profit_rate_ov = round((total_profit_ov / (total_portfolio_value - total_profit_ov) * 100), 1) if (total_portfolio_value - total_profit_ov) > 0 else 0
-    
-    ref_label = f" ({REFERENCE_DATE} 기준)" if is_historical else ""
-
-    total_value_html = clean_html(f"""
-    <div class="total-value-card">
-        <div class="total-value-title">Total Portfolio Value{ref_label}</div>
-        <div class="total-value-amount">{total_portfolio_value:,}</div>
-        <div class="value-divider"></div>
-        <div class="profit-section">
-            <div class="profit-label">Total Profit</div>
-            <div class="profit-row">
-                <div class="tooltip-wrap">
-                    <div class="profit-amount">+{total_profit_ov:,}</div>
-                    <div class="tooltip-box">
-                        미실현 &nbsp;+{total_strategy_current_profit:,}<br>
-                        실현 &nbsp;&nbsp;&nbsp;+{total_strategy_actual_profit:,}
-                    </div>
-                </div>
-                <div class="profit-badge">+{total_profit_rate_ov}%</div>
-            </div>
-        </div>
-    </div>
-    """)
-    
-    stock_value_ov = total_strategy_value
-    local_cash = local_summary["cash"]
-    
-    df_trade_us = trade_dfs["US"]
-    df_cash_us = cash_df[cash_df["계좌명"] == "US"]
-    _, s_us = calculate_account_summary(df_trade_us, df_cash_us, df_dividend, price_map, is_us_stock=True)
-    us_cash = s_us["cash"] * exchange_rate
-    
-    try:
-        separate_cash_df = conn.read(worksheet="입출금", usecols=[8], nrows=1, header=None)
-        separate_cash = float(separate_cash_df.iloc[0, 0]) if not separate_cash_df.empty else 0
-    except:
-        separate_cash = 0
-    
-    cash_value_ov = local_cash + us_cash + separate_cash
-    
-    total_asset = stock_value_ov + cash_value_ov
-    stock_ratio_ov = (stock_value_ov / total_asset * 100) if total_asset > 0 else 0
-    cash_ratio_ov = (cash_value_ov / total_asset * 100) if total_asset > 0 else 0
-    
-    us_value = strategies[0]["value"] + strategies[1]["value"] + strategies[2]["value"]
-    kr_value = strategies[3]["value"] + strategies[4]["value"]
-    
-    total_country = us_value + kr_value
-    us_ratio = (us_value / total_country * 100) if total_country > 0 else 0
-    kr_ratio = (kr_value / total_country * 100) if total_country > 0 else 0
-    
-    allocation_html = clean_html(f"""
-    <div class="card">
-        <div class="card-title">Allocation</div>
-        <div style="margin-top: 20px; margin-bottom: 24px;">
-            <div style="font-size: 14px; font-weight: 600; color: #7F8C8D; margin-bottom: 12px; padding-left: 8px;">ASSET ALLOCATION</div>
-            <div style="display: flex; flex-direction: column; gap: 8px;">
-                <div style="display: grid; grid-template-columns: 80px 1fr auto; align-items: center; gap: 16px; background: #f8f9fa; padding: 14px 16px; border-radius: 10px;">
-                    <div style="font-size: 13px; font-weight: 600; color: #555;">Stock</div>
-                    <div style="font-size: 18px; font-weight: 700; color: #0f2f76;">{int(stock_value_ov):,}</div>
-                    <div style="background: #778ad5; color: white; padding: 6px 14px; border-radius: 8px; font-size: 13px; font-weight: 700; width: 70px; text-align: center;">{stock_ratio_ov:.1f}%</div>
-                </div>
-                <div style="display: grid; grid-template-columns: 80px 1fr auto; align-items: center; gap: 16px; background: #f8f9fa; padding: 14px 16px; border-radius: 10px;">
-                    <div style="font-size: 13px; font-weight: 600; color: #555;">Cash</div>
-                    <div style="font-size: 18px; font-weight: 700; color: #0f2f76;">{int(cash_value_ov):,}</div>
-                    <div style="background: #b2c2ff; color: white; padding: 6px 14px; border-radius: 8px; font-size: 13px; font-weight: 700; width: 70px; text-align: center;">{cash_ratio_ov:.1f}%</div>
-                </div>
-            </div>
-        </div>
-        <div style="margin-top: 24px;">
-            <div style="font-size: 14px; font-weight: 600; color: #7F8C8D; margin-bottom: 12px; padding-left: 8px;">COUNTRY ALLOCATION</div>
-            <div style="display: flex; flex-direction: column; gap: 8px;">
-                <div style="display: grid; grid-template-columns: 80px 1fr auto; align-items: center; gap: 16px; background: #f8f9fa; padding: 14px 16px; border-radius: 10px;">
-                    <div style="font-size: 13px; font-weight: 600; color: #555;">US</div>
-                    <div style="font-size: 18px; font-weight: 700; color: #0f2f76;">{int(us_value):,}</div>
-                    <div style="background: #778ad5; color: white; padding: 6px 14px; border-radius: 8px; font-size: 13px; font-weight: 700; width: 70px; text-align: center;">{us_ratio:.1f}%</div>
-                </div>
-                <div style="display: grid; grid-template-columns: 80px 1fr auto; align-items: center; gap: 16px; background: #f8f9fa; padding: 14px 16px; border-radius: 10px;">
-                    <div style="font-size: 13px; font-weight: 600; color: #555;">KR</div>
-                    <div style="font-size: 18px; font-weight: 700; color: #0f2f76;">{int(kr_value):,}</div>
-                    <div style="background: #b2c2ff; color: white; padding: 6px 14px; border-radius: 8px; font-size: 13px; font-weight: 700; width: 70px; text-align: center;">{kr_ratio:.1f}%</div>
-                </div>
-            </div>
-        </div>
-    </div>
-    """)
-    
-    strategy_items = ""
-    for strategy in strategies:
-        strategy_items += f"""
+def strategy_row_html(name, color, weight, value, profit, current_profit, actual_profit, rate):
+    return clean_html(f"""
             <div style="display: grid; grid-template-columns: 100px 2fr 2fr 1.5fr;
                         padding: 18px 20px; align-items: center;
                         border-bottom: 1px solid #f0f0f0;
@@ -1155,40 +782,47 @@ if selected_tab == "성과":
                  onmouseout="this.style.background='transparent'">
                 <div style="position: relative; width: 80px; height: 80px; flex-shrink: 0;">
                     <div style="position: absolute; width: 80px; height: 80px; border-radius: 50%;
-                                background: conic-gradient(from 0deg, {strategy['color']} 0deg {strategy['weight'] * 3.6}deg, #e5e5e5 {strategy['weight'] * 3.6}deg 360deg);"></div>
+                                background: conic-gradient(from 0deg, {color} 0deg {weight * 3.6}deg, #e5e5e5 {weight * 3.6}deg 360deg);"></div>
                     <div style="position: absolute; width: 56px; height: 56px; background: white;
                                 border-radius: 50%; top: 12px; left: 12px;"></div>
                     <div style="position: absolute; top: 50%; left: 50%; transform: translate(-50%, -50%);
-                                font-size: 14px; font-weight: 700; color: {strategy['color']}; z-index: 10;">
-                        {strategy['weight']}%
+                                font-size: 14px; font-weight: 700; color: {color}; z-index: 10;">
+                        {weight}%
                     </div>
                 </div>
                 <div>
-                    <div style="font-size: 15px; font-weight: 600; color: #2C3E50;">{strategy['name']}</div>
+                    <div style="font-size: 15px; font-weight: 600; color: #2C3E50;">{name}</div>
                 </div>
                 <div style="text-align: right; display: flex; flex-direction: column; gap: 6px;">
-                    <div style="font-size: 17px; font-weight: 600; color: #2C3E50;">{strategy['value']:,}</div>
+                    <div style="font-size: 17px; font-weight: 600; color: #2C3E50;">{value:,}</div>
                     <div class="tooltip-wrap" style="text-align: right;">
-                        <div style="font-size: 15px; font-weight: 600; color: {'#3A866A' if strategy['profit'] >= 0 else '#C54E4A'};">
-                            {'+' if strategy['profit'] >= 0 else ''}{strategy['profit']:,}
+                        <div style="font-size: 15px; font-weight: 600; color: {'#3A866A' if profit >= 0 else '#C54E4A'};">
+                            {'+' if profit >= 0 else ''}{profit:,}
                         </div>
                         <div class="tooltip-box">
-                            미실현 &nbsp;{'+' if strategy['current_profit'] >= 0 else ''}{strategy['current_profit']:,}<br>
-                            실현 &nbsp;&nbsp;&nbsp;{'+' if strategy['actual_profit'] >= 0 else ''}{strategy['actual_profit']:,}
+                            미실현 &nbsp;{'+' if current_profit >= 0 else ''}{current_profit:,}<br>
+                            실현 &nbsp;&nbsp;&nbsp;{'+' if actual_profit >= 0 else ''}{actual_profit:,}
                         </div>
                     </div>
                 </div>
                 <div style="text-align: right;">
-                    <div style="background: {strategy['color']}20; color: {strategy['color']};
+                    <div style="background: {color}20; color: {color};
                                 font-size: 14px; font-weight: 700;
                                 padding: 6px 12px; border-radius: 8px; display: inline-block;">
-                        {'+' if strategy['rate'] >= 0 else ''}{strategy['rate']}%
+                        {'+' if rate >= 0 else ''}{rate}%
                     </div>
                 </div>
             </div>
-        """
-    
-    strategy_html = clean_html(f"""
+        """)
+
+def build_strategy_html(strategies):
+    """Strategy Performance 카드 (전략 행은 내용 값 기준으로 캐시)"""
+    rows = [
+        cached_fragment(strategy_row_html, strategy["name"], strategy["color"], strategy["weight"], strategy["value"],
+                        strategy["profit"], strategy["current_profit"], strategy["actual_profit"], strategy["rate"])
+        for strategy in strategies
+    ]
+    return "".join([clean_html("""
     <div class="card" style="height: 785px;">
         <div class="card-title">Strategy Performance</div>
         <div style="display: grid; grid-template-columns: 100px 2fr 2fr 1.5fr;
@@ -1201,67 +835,119 @@ if selected_tab == "성과":
             <div style="text-align: center;">Return</div>
         </div>
         <div style="display: flex; flex-direction: column; gap: 2px; margin-top: 8px;">
-            {strategy_items}
+            """), *rows, clean_html("""
         </div>
     </div>
-    """)
+    """)])
+
+# --- 인디케이터 스타일 ---
+def get_indicator(val):
+    """과거월: 시트 월간수익률 기준 (소수 형태, 예: 0.025 = 2.5%)"""
+    if val > 0.01:
+        return ' <span style="color: #3A866A; font-size: 18px;">●</span>'
+    elif val < -0.01:
+        return ' <span style="color: #C54E4A; font-size: 18px;">●</span>'
+    else:
+        return ' <span style="color: #95a5a6; font-size: 18px;">●</span>'
+
+def get_indicator_by_mom(val):
+    """당월: MoM 절대금액 기준"""
+    if val > 0:
+        return ' <span style="color: #3A866A; font-size: 18px;">●</span>'
+    elif val < 0:
+        return ' <span style="color: #C54E4A; font-size: 18px;">●</span>'
+    else:
+        return ' <span style="color: #95a5a6; font-size: 18px;">●</span>'
 
-    # --- 월간 성과 데이터 불러오기 ---
-    try:
-        performance_df = conn.read(worksheet="성과")
-        performance_df.columns = performance_df.columns.str.strip()   
-        performance_df["기준일"] = pd.to_datetime(performance_df["기준일"])
-        performance_df = performance_df.sort_values("기준일", ascending=False)
-        
-        monthly_totals = performance_df.groupby("기준일").agg({
-            "평가액": "sum",
-            "누적수익": "sum",
-            "월간수익": "sum"
-        }).reset_index().sort_values("기준일", ascending=False)
-
-        recent_3_months = monthly_totals.head(3)
-        recent_6_months = monthly_totals.head(6)
-        
-    except Exception as e:
-        st.error(f"성과 데이터 로드 실패: {e}")
-        recent_6_months = pd.DataFrame()
-        recent_3_months = pd.DataFrame()
-
-    # --- 인디케이터 스타일 ---
-    def get_indicator(val):
-        """과거월: 시트 월간수익률 기준 (소수 형태, 예: 0.025 = 2.5%)"""
-        if val > 0.01:
-            return ' <span style="color: #3A866A; font-size: 18px;">●</span>'
-        elif val < -0.01:
-            return ' <span style="color: #C54E4A; font-size: 18px;">●</span>'
-        else:
-            return ' <span style="color: #95a5a6; font-size: 18px;">●</span>'
-
-    def get_indicator_by_mom(val):
-        """당월: MoM 절대금액 기준"""
-        if val > 0:
-            return ' <span style="color: #3A866A; font-size: 18px;">●</span>'
-        elif val < 0:
-            return ' <span style="color: #C54E4A; font-size: 18px;">●</span>'
-        else:
-            return ' <span style="color: #95a5a6; font-size: 18px;">●</span>'
+def monthly_card_html(color, month_str, total_asset, mom_change):
+    """total_asset이 None이면 부분 집계 월 (WRAP 이력 없음): 합계 대신 표시만"""
+    if total_asset is None:
+        total_text, badge, label = "–", "부분 집계", "WRAP 이력 없음"
+    else:
+        sign = "+" if mom_change >= 0 else ""
+        total_text, badge, label = f"{total_asset:,}", f"{sign}{mom_change:,.0f}", "MoM"
+    return clean_html(f"""
+                <div style="background: {color}; border-radius: 12px; padding: 20px; color: white;">
+                    <div style="font-size: 13px; opacity: 0.9; margin-bottom: 8px;">{month_str}</div>
+                    <div style="font-size: 28px; font-weight: 700; margin-bottom: 16px;">{total_text}</div>
+                    <div style="display: flex; align-items: center; gap: 8px;">
+                        <div style="background: rgba(255,255,255,0.2); padding: 4px 10px; border-radius: 6px; font-size: 13px; font-weight: 600;">
+                            {badge}
+                        </div>
+                        <div style="font-size: 13px; opacity: 0.9;">{label}</div>
+                    </div>
+                </div>
+                """)
+
+def monthly_row_html(month_str, bg_color, us_market_val, us_ai_val, us_wrap_val, kr_leverage_val, kr_sector_val, total_val,
+                     us_market_indicator, us_ai_indicator, us_wrap_indicator, kr_leverage_indicator, kr_sector_indicator):
+    """값이 None인 칸(비워 둔 WRAP, 부분 집계 월의 Total)은 – 로 표시"""
+    def million(val):
+        return "–" if val is None else f"{val/1000000:.1f}M"
+
+    return clean_html(f"""
+                <div style="display: grid; grid-template-columns: 100px repeat(6, 1fr);
+                            padding: 14px 16px; align-items: center; border-bottom: 1px solid #f0f0f0;
+                            background: {bg_color};">
+                    <div style="font-weight: 600; color: #2C3E50;">{month_str}</div>
+                    <div style="text-align: right; font-size: 14px; color: #555;">{million(us_market_val)}{us_market_indicator}</div>
+                    <div style="text-align: right; font-size: 14px; color: #555;">{million(us_ai_val)}{us_ai_indicator}</div>
+                    <div style="text-align: right; font-size: 14px; color: #555;">{million(us_wrap_val)}{us_wrap_indicator}</div>
+                    <div style="text-align: right; font-size: 14px; color: #555;">{million(kr_leverage_val)}{kr_leverage_indicator}</div>
+                    <div style="text-align: right; font-size: 14px; color: #555;">{million(kr_sector_val)}{kr_sector_indicator}</div>
+                    <div style="text-align: right; font-size: 16px; font-weight: 700; color: #0f2f76;">{million(total_val)}</div>
+                </div>
+                """)
+
+def monthly_mom_html(us_market_mom, us_ai_mom, us_wrap_mom, kr_leverage_mom, kr_sector_mom, total_mom):
+    def get_mom_color(val):
+        return "#3A866A" if val >= 0 else "#C54E4A"
+
+    def get_mom_sign(val):
+        return "+" if val >= 0 else ""
+
+    invisible_dot = ' <span style="color: #f0f7ff; font-size: 18px;">●</span>'
+
+    return clean_html(f"""
+            <div style="display: grid; grid-template-columns: 100px repeat(6, 1fr);
+                        padding: 14px 16px; align-items: center; background: #f0f7ff; border-radius: 8px; margin-top: 8px;">
+                <div style="font-weight: 700; color: #0f2f76;">MoM Change</div>
+                <div style="text-align: right; font-size: 14px; font-weight: 600; color: {get_mom_color(us_market_mom)};">{get_mom_sign(us_market_mom)}{us_market_mom/1000000:.1f}M{invisible_dot}</div>
+                <div style="text-align: right; font-size: 14px; font-weight: 600; color: {get_mom_color(us_ai_mom)};">{get_mom_sign(us_ai_mom)}{us_ai_mom/1000000:.1f}M{invisible_dot}</div>
+                <div style="text-align: right; font-size: 14px; font-weight: 600; color: {get_mom_color(us_wrap_mom)};">{get_mom_sign(us_wrap_mom)}{us_wrap_mom/1000000:.1f}M{invisible_dot}</div>
+                <div style="text-align: right; font-size: 14px; font-weight: 600; color: {get_mom_color(kr_leverage_mom)};">{get_mom_sign(kr_leverage_mom)}{kr_leverage_mom/1000000:.1f}M{invisible_dot}</div>
+                <div style="text-align: right; font-size: 14px; font-weight: 600; color: {get_mom_color(kr_sector_mom)};">{get_mom_sign(kr_sector_mom)}{kr_sector_mom/1000000:.1f}M{invisible_dot}</div>
+                <div style="text-align: right; font-size: 16px; font-weight: 700; color: {get_mom_color(total_mom)};">{get_mom_sign(total_mom)}{total_mom/1000000:.1f}M</div>
+            </div>
+            """)
+
+MONTHLY_TABLE_MONTHS = 6  # 월별 전략 테이블 행 수 (12, 24개월 등)
+
+def build_monthly_performance_html(performance_df, monthly_totals, strategies, total_strategy_value,
+                                   table_months=MONTHLY_TABLE_MONTHS):
+    """월간 성과 카드: 최근 3개월 요약 + table_months개월 전략별 테이블 + MoM
+    카드·행 조각은 내용 값 기준으로 캐시, 조각 목록을 한 번에 결합"""
+    recent_3_months = monthly_totals.head(3)
+    recent_6_months = monthly_totals.head(table_months)
 
     # --- 통합 카드: 3개월 카드 + 테이블 ---
     if not recent_3_months.empty:
-        monthly_performance_html = '<div class="card" style="margin-top: 24px;">'
+        parts = ['<div class="card" style="margin-top: 24px;">']
         
-        monthly_performance_html += """
+        parts.append(clean_html("""
         <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 20px;">
             <div style="font-size: 20px; font-weight: 600; color: #444;">Monthly Performance Detail</div>
             <div style="font-size: 13px; color: #95a5a6;">Recent 3 months</div>
         </div>
-        """
+        """))
         
         if not recent_6_months.empty:
-            strategy_monthly = performance_df[performance_df["전략"] != "Total"].copy()
-            latest_dates = monthly_totals.head(6)["기준일"].tolist()
+            # 기준일 × 전략 피벗 1회, 이후 조회는 인덱싱 (표 기간이 길어져도 셀당 조회 비용 일정)
+            index = PerformanceIndex(performance_df)
+            total_by_date = dict(zip(monthly_totals["기준일"], monthly_totals["평가액"]))
+            sheet_names = list(PERFORMANCE_STRATEGY_NAMES.values())
+            latest_dates = monthly_totals.head(table_months)["기준일"].tolist()
             latest_dates.reverse()
-            strategy_monthly = strategy_monthly[strategy_monthly["기준일"].isin(latest_dates)]
 
             # =====================================================
             # MoM 계산 - 루프 전에 미리 계산
@@ -1269,26 +955,18 @@ if selected_tab == "성과":
             us_market_mom = us_ai_mom = us_wrap_mom = kr_leverage_mom = kr_sector_mom = total_mom = 0
 
             if len(latest_dates) >= 2:
-                current_month_idx = len(latest_dates) - 1
-                prev_month_idx = len(latest_dates) - 2
-
-                prev_month_strategies = strategy_monthly[strategy_monthly["기준일"] == latest_dates[prev_month_idx]]
+                prev_month = latest_dates[-2]
 
                 def calc_mom(current_val, prev_val, purchase):
                     return current_val - prev_val - purchase
 
-                prev_us_wrap_profit = int(prev_month_strategies[prev_month_strategies["전략"] == "US Wrap"]["누적수익"].values[0]) if len(prev_month_strategies[prev_month_strategies["전략"] == "US Wrap"]) > 0 else 0
-                prev_kr_leverage = int(prev_month_strategies[prev_month_strategies["전략"] == "KR Leverage"]["평가액"].values[0]) if len(prev_month_strategies[prev_month_strategies["전략"] == "KR Leverage"]) > 0 else 0
+                prev_us_wrap_profit = int(index.get(prev_month, "US Wrap", "누적수익"))
+                prev_kr_leverage = int(index.get(prev_month, "KR Leverage", "평가액"))
 
-                prev_us_market_profit = int(prev_month_strategies[prev_month_strategies["전략"] == "US Market"]["누적수익"].values[0]) if len(prev_month_strategies[prev_month_strategies["전략"] == "US Market"]) > 0 else 0
-                prev_us_ai_profit = int(prev_month_strategies[prev_month_strategies["전략"] == "US AI Power"]["누적수익"].values[0]) if len(prev_month_strategies[prev_month_strategies["전략"] == "US AI Power"]) > 0 else 0
-                prev_kr_sector_profit = int(prev_month_strategies[prev_month_strategies["전략"] == "KR Sector"]["누적수익"].values[0]) if len(prev_month_strategies[prev_month_strategies["전략"] == "KR Sector"]) > 0 else 0
+                prev_us_market_profit = int(index.get(prev_month, "US Market", "누적수익"))
+                prev_us_ai_profit = int(index.get(prev_month, "US AI Power", "누적수익"))
+                prev_kr_sector_profit = int(index.get(prev_month, "KR Sector", "누적수익"))
 
-                wrap_data = performance_df[
-                    (performance_df["기준일"] == latest_dates[current_month_idx]) &
-                    (performance_df["전략"] == "US Wrap")
-                ]
-                us_wrap_purchase = float(wrap_data["운용증가"].values[0]) if not wrap_data.empty and pd.notna(wrap_data["운용증가"].values[0]) else 0
 
                 us_market_mom = strategies[0]["profit"] - prev_us_market_profit
                 us_ai_mom = strategies[1]["profit"] - prev_us_ai_profit
@@ -1299,7 +977,7 @@ if selected_tab == "성과":
                 total_mom = us_market_mom + us_ai_mom + us_wrap_mom + kr_leverage_mom + kr_sector_mom
             # =====================================================
 
-            monthly_performance_html += '<div style="display: grid; grid-template-columns: repeat(3, 1fr); gap: 16px;">'
+            parts.append('<div style="display: grid; grid-template-columns: repeat(3, 1fr); gap: 16px;">')
             
             card_colors = ["#778AD5", "#95a5a6", "#95a5a6"]
         
@@ -1310,30 +988,20 @@ if selected_tab == "성과":
                 if idx == recent_3_months.index[0]:
                     total_asset = total_strategy_value
                     mom_change = total_mom
+                elif row["부분"]:
+                    total_asset = None
+                    mom_change = 0
                 else:
                     total_asset = int(row["평가액"])
                     mom_change = int(row["월간수익"]) if pd.notna(row["월간수익"]) else 0
                 
-                sign = "+" if mom_change >= 0 else ""
-                
-                monthly_performance_html += f"""
-                <div style="background: {card_colors[i]}; border-radius: 12px; padding: 20px; color: white;">
-                    <div style="font-size: 13px; opacity: 0.9; margin-bottom: 8px;">{month_str}</div>
-                    <div style="font-size: 28px; font-weight: 700; margin-bottom: 16px;">{total_asset:,}</div>
-                    <div style="display: flex; align-items: center; gap: 8px;">
-                        <div style="background: rgba(255,255,255,0.2); padding: 4px 10px; border-radius: 6px; font-size: 13px; font-weight: 600;">
-                            {sign}{mom_change:,.0f}
-                        </div>
-                        <div style="font-size: 13px; opacity: 0.9;">MoM</div>
-                    </div>
-                </div>
-                """
+                parts.append(cached_fragment(monthly_card_html, card_colors[i], month_str, total_asset, mom_change))
             
-            monthly_performance_html += '</div>'
-            monthly_performance_html += '<div style="border-top: 1px solid #e5e5e5; margin: 32px 0;"></div>'
+            parts.append('</div>')
+            parts.append('<div style="border-top: 1px solid #e5e5e5; margin: 32px 0;"></div>')
 
             # 테이블 헤더
-            monthly_performance_html += """
+            parts.append(clean_html("""
             <div style="display: grid; grid-template-columns: 100px repeat(6, 1fr);
                         padding: 12px 16px; background: #f8f9fa; border-radius: 8px;
                         font-size: 12px; font-weight: 600; color: #6c757d; margin-bottom: 8px;">
@@ -1345,7 +1013,7 @@ if selected_tab == "성과":
                 <div style="text-align: right; margin-right: 15px;">KR ETF</div>
                 <div style="text-align: right; margin-right: 18px;">Total</div>
             </div>
-            """
+            """))
             
             # 월별 데이터 행
             for idx, month_date in enumerate(latest_dates):
@@ -1368,31 +1036,19 @@ if selected_tab == "성과":
                     kr_sector_indicator = get_indicator_by_mom(kr_sector_mom)
 
                 else:
-                    # 과거월: 성과 시트 값
-                    month_strategies = strategy_monthly[strategy_monthly["기준일"] == month_date]
-                    
-                    us_market_val = int(month_strategies[month_strategies["전략"] == "US Market"]["평가액"].values[0]) if len(month_strategies[month_strategies["전략"] == "US Market"]) > 0 else 0
-                    us_ai_val = int(month_strategies[month_strategies["전략"] == "US AI Power"]["평가액"].values[0]) if len(month_strategies[month_strategies["전략"] == "US AI Power"]) > 0 else 0
-                    us_wrap_val = int(month_strategies[month_strategies["전략"] == "US Wrap"]["평가액"].values[0]) if len(month_strategies[month_strategies["전략"] == "US Wrap"]) > 0 else 0
-                    kr_leverage_val = int(month_strategies[month_strategies["전략"] == "KR Leverage"]["평가액"].values[0]) if len(month_strategies[month_strategies["전략"] == "KR Leverage"]) > 0 else 0
-                    kr_sector_val = int(month_strategies[month_strategies["전략"] == "KR Sector"]["평가액"].values[0]) if len(month_strategies[month_strategies["전략"] == "KR Sector"]) > 0 else 0
-                    
-                    total_row = monthly_totals[monthly_totals["기준일"] == month_date]
-                    total_val = int(total_row["평가액"].values[0]) if not total_row.empty else 0
+                    # 과거월: 성과 시트 값 (비워 둔 칸은 None → –)
+                    values = [index.get(month_date, name, "평가액", default=None) for name in sheet_names]
+                    us_market_val, us_ai_val, us_wrap_val, kr_leverage_val, kr_sector_val = (
+                        None if val is None else int(val) for val in values
+                    )
+                    total = total_by_date.get(month_date, 0)
+                    total_val = int(total) if pd.notna(total) else None
 
                     # 과거월 인디케이터: 시트 월간수익률 기준 (첫 번째 월 제외)
                     if idx > 0:
-                        us_market_rate = float(month_strategies[month_strategies["전략"] == "US Market"]["월간수익률"].values[0]) if len(month_strategies[month_strategies["전략"] == "US Market"]) > 0 else 0
-                        us_ai_rate = float(month_strategies[month_strategies["전략"] == "US AI Power"]["월간수익률"].values[0]) if len(month_strategies[month_strategies["전략"] == "US AI Power"]) > 0 else 0
-                        us_wrap_rate = float(month_strategies[month_strategies["전략"] == "US Wrap"]["월간수익률"].values[0]) if len(month_strategies[month_strategies["전략"] == "US Wrap"]) > 0 else 0
-                        kr_leverage_rate = float(month_strategies[month_strategies["전략"] == "KR Leverage"]["월간수익률"].values[0]) if len(month_strategies[month_strategies["전략"] == "KR Leverage"]) > 0 else 0
-                        kr_sector_rate = float(month_strategies[month_strategies["전략"] == "KR Sector"]["월간수익률"].values[0]) if len(month_strategies[month_strategies["전략"] == "KR Sector"]) > 0 else 0
-
-                        us_market_indicator = get_indicator(us_market_rate)
-                        us_ai_indicator = get_indicator(us_ai_rate)
-                        us_wrap_indicator = get_indicator(us_wrap_rate)
-                        kr_leverage_indicator = get_indicator(kr_leverage_rate)
-                        kr_sector_indicator = get_indicator(kr_sector_rate)
+                        us_market_indicator, us_ai_indicator, us_wrap_indicator, kr_leverage_indicator, kr_sector_indicator = (
+                            get_indicator(float(index.get(month_date, name, "월간수익률"))) for name in sheet_names
+                        )
                     else:
                         # 가장 첫 번째 과거월은 투명
                         us_market_indicator = ' <span style="color: #ffffff; font-size: 18px;">●</span>'
@@ -1403,47 +1059,145 @@ if selected_tab == "성과":
                 
                 bg_color = "#fafafa" if idx % 2 == 1 else "transparent"
                 
-                monthly_performance_html += f"""
-                <div style="display: grid; grid-template-columns: 100px repeat(6, 1fr);
-                            padding: 14px 16px; align-items: center; border-bottom: 1px solid #f0f0f0;
-                            background: {bg_color};">
-                    <div style="font-weight: 600; color: #2C3E50;">{month_str}</div>
-                    <div style="text-align: right; font-size: 14px; color: #555;">{us_market_val/1000000:.1f}M{us_market_indicator}</div>
-                    <div style="text-align: right; font-size: 14px; color: #555;">{us_ai_val/1000000:.1f}M{us_ai_indicator}</div>
-                    <div style="text-align: right; font-size: 14px; color: #555;">{us_wrap_val/1000000:.1f}M{us_wrap_indicator}</div>
-                    <div style="text-align: right; font-size: 14px; color: #555;">{kr_leverage_val/1000000:.1f}M{kr_leverage_indicator}</div>
-                    <div style="text-align: right; font-size: 14px; color: #555;">{kr_sector_val/1000000:.1f}M{kr_sector_indicator}</div>
-                    <div style="text-align: right; font-size: 16px; font-weight: 700; color: #0f2f76;">{total_val/1000000:.1f}M</div>
-                </div>
-                """
+                parts.append(cached_fragment(
+                    monthly_row_html, month_str, bg_color,
+                    us_market_val, us_ai_val, us_wrap_val, kr_leverage_val, kr_sector_val, total_val,
+                    us_market_indicator, us_ai_indicator, us_wrap_indicator, kr_leverage_indicator, kr_sector_indicator,
+                ))
             
             # MoM Change 행
-            def get_mom_color(val):
-                return "#3A866A" if val >= 0 else "#C54E4A"
-            
-            def get_mom_sign(val):
-                return "+" if val >= 0 else ""
-            
-            invisible_dot = ' <span style="color: #f0f7ff; font-size: 18px;">●</span>'
-            
-            monthly_performance_html += f"""
-            <div style="display: grid; grid-template-columns: 100px repeat(6, 1fr);
-                        padding: 14px 16px; align-items: center; background: #f0f7ff; border-radius: 8px; margin-top: 8px;">
-                <div style="font-weight: 700; color: #0f2f76;">MoM Change</div>
-                <div style="text-align: right; font-size: 14px; font-weight: 600; color: {get_mom_color(us_market_mom)};">{get_mom_sign(us_market_mom)}{us_market_mom/1000000:.1f}M{invisible_dot}</div>
-                <div style="text-align: right; font-size: 14px; font-weight: 600; color: {get_mom_color(us_ai_mom)};">{get_mom_sign(us_ai_mom)}{us_ai_mom/1000000:.1f}M{invisible_dot}</div>
-                <div style="text-align: right; font-size: 14px; font-weight: 600; color: {get_mom_color(us_wrap_mom)};">{get_mom_sign(us_wrap_mom)}{us_wrap_mom/1000000:.1f}M{invisible_dot}</div>
-                <div style="text-align: right; font-size: 14px; font-weight: 600; color: {get_mom_color(kr_leverage_mom)};">{get_mom_sign(kr_leverage_mom)}{kr_leverage_mom/1000000:.1f}M{invisible_dot}</div>
-                <div style="text-align: right; font-size: 14px; font-weight: 600; color: {get_mom_color(kr_sector_mom)};">{get_mom_sign(kr_sector_mom)}{kr_sector_mom/1000000:.1f}M{invisible_dot}</div>
-                <div style="text-align: right; font-size: 16px; font-weight: 700; color: {get_mom_color(total_mom)};">{get_mom_sign(total_mom)}{total_mom/1000000:.1f}M</div>
-            </div>
-            """
+            parts.append(cached_fragment(monthly_mom_html, us_market_mom, us_ai_mom, us_wrap_mom, kr_leverage_mom, kr_sector_mom, total_mom))
         
-        monthly_performance_html += '</div>'
-        monthly_performance_html = clean_html(monthly_performance_html)
+        parts.append('</div>')
+        monthly_performance_html = "".join(parts)
     else:
         monthly_performance_html = ""
 
+    return monthly_performance_html
+
+if selected_tab == "성과":
+    
+    overview = results["strategies"]
+    for message in overview["warnings"]:
+        st.warning(message)
+
+    strategies = [{**strategy, "color": STRATEGY_COLORS[strategy["name"]]} for strategy in overview["strategies"]]
+
+    total_strategy_value = sum(s["value"] for s in strategies)
+    total_strategy_profit = sum(s["profit"] for s in strategies)
+    total_strategy_current_profit = sum(s["current_profit"] for s in strategies)  
+    total_strategy_actual_profit = sum(s["actual_profit"] for s in strategies)    
+    
+    total_portfolio_value = total_strategy_value
+    total_profit_ov = total_strategy_profit
+    total_profit_rate_ov = round((total_profit_ov / (total_portfolio_value - total_profit_ov) * 100), 1) if (total_portfolio_value - total_profit_ov) > 0 else 0
+    
+    ref_label = f" ({ref_date:%Y-%m-%d} 기준)" if is_historical else ""
+
+    total_value_html = clean_html(f"""
+    <div class="total-value-card">
+        <div class="total-value-title">Total Portfolio Value{ref_label}</div>
+        <div class="total-value-amount">{total_portfolio_value:,}</div>
+        <div class="value-divider"></div>
+        <div class="profit-section">
+            <div class="profit-label">Total Profit</div>
+            <div class="profit-row">
+                <div class="tooltip-wrap">
+                    <div class="profit-amount">+{total_profit_ov:,}</div>
+                    <div class="tooltip-box">
+                        미실현 &nbsp;+{total_strategy_current_profit:,}<br>
+                        실현 &nbsp;&nbsp;&nbsp;+{total_strategy_actual_profit:,}
+                    </div>
+                </div>
+                <div class="profit-badge">+{total_profit_rate_ov}%</div>
+            </div>
+        </div>
+    </div>
+    """)
+    
+    stock_value_ov = total_strategy_value
+    local_cash = results["local_total"][1]["cash"]
+    
+    _, s_us = results["summary:US"]
+    us_cash = s_us["cash"] * exchange_rate
+    
+    separate_cash = snapshot.separate_cash
+    
+    cash_value_ov = local_cash + us_cash + separate_cash
+    
+    total_asset = stock_value_ov + cash_value_ov
+    stock_ratio_ov = (stock_value_ov / total_asset * 100) if total_asset > 0 else 0
+    cash_ratio_ov = (cash_value_ov / total_asset * 100) if total_asset > 0 else 0
+    
+    us_value = strategies[0]["value"] + strategies[1]["value"] + strategies[2]["value"]
+    kr_value = strategies[3]["value"] + strategies[4]["value"]
+    
+    total_country = us_value + kr_value
+    us_ratio = (us_value / total_country * 100) if total_country > 0 else 0
+    kr_ratio = (kr_value / total_country * 100) if total_country > 0 else 0
+    
+    allocation_html = clean_html(f"""
+    <div class="card">
+        <div class="card-title">Allocation</div>
+        <div style="margin-top: 20px; margin-bottom: 24px;">
+            <div style="font-size: 14px; font-weight: 600; color: #7F8C8D; margin-bottom: 12px; padding-left: 8px;">ASSET ALLOCATION</div>
+            <div style="display: flex; flex-direction: column; gap: 8px;">
+                <div style="display: grid; grid-template-columns: 80px 1fr auto; align-items: center; gap: 16px; background: #f8f9fa; padding: 14px 16px; border-radius: 10px;">
+                    <div style="font-size: 13px; font-weight: 600; color: #555;">Stock</div>
+                    <div style="font-size: 18px; font-weight: 700; color: #0f2f76;">{int(stock_value_ov):,}</div>
+                    <div style="background: #778ad5; color: white; padding: 6px 14px; border-radius: 8px; font-size: 13px; font-weight: 700; width: 70px; text-align: center;">{stock_ratio_ov:.1f}%</div>
+                </div>
+                <div style="display: grid; grid-template-columns: 80px 1fr auto; align-items: center; gap: 16px; background: #f8f9fa; padding: 14px 16px; border-radius: 10px;">
+                    <div style="font-size: 13px; font-weight: 600; color: #555;">Cash</div>
+                    <div style="font-size: 18px; font-weight: 700; color: #0f2f76;">{int(cash_value_ov):,}</div>
+                    <div style="background: #b2c2ff; color: white; padding: 6px 14px; border-radius: 8px; font-size: 13px; font-weight: 700; width: 70px; text-align: center;">{cash_ratio_ov:.1f}%</div>
+                </div>
+            </div>
+        </div>
+        <div style="margin-top: 24px;">
+            <div style="font-size: 14px; font-weight: 600; color: #7F8C8D; margin-bottom: 12px; padding-left: 8px;">COUNTRY ALLOCATION</div>
+            <div style="display: flex; flex-direction: column; gap: 8px;">
+                <div style="display: grid; grid-template-columns: 80px 1fr auto; align-items: center; gap: 16px; background: #f8f9fa; padding: 14px 16px; border-radius: 10px;">
+                    <div style="font-size: 13px; font-weight: 600; color: #555;">US</div>
+                    <div style="font-size: 18px; font-weight: 700; color: #0f2f76;">{int(us_value):,}</div>
+                    <div style="background: #778ad5; color: white; padding: 6px 14px; border-radius: 8px; font-size: 13px; font-weight: 700; width: 70px; text-align: center;">{us_ratio:.1f}%</div>
+                </div>
+                <div style="display: grid; grid-template-columns: 80px 1fr auto; align-items: center; gap: 16px; background: #f8f9fa; padding: 14px 16px; border-radius: 10px;">
+                    <div style="font-size: 13px; font-weight: 600; color: #555;">KR</div>
+                    <div style="font-size: 18px; font-weight: 700; color: #0f2f76;">{int(kr_value):,}</div>
+                    <div style="background: #b2c2ff; color: white; padding: 6px 14px; border-radius: 8px; font-size: 13px; font-weight: 700; width: 70px; text-align: center;">{kr_ratio:.1f}%</div>
+                </div>
+            </div>
+        </div>
+    </div>
+    """)
+    
+    with trace.span("html:strategy"):
+        strategy_html = build_strategy_html(strategies)
+
+    # --- 월간 성과 데이터 불러오기 (성과 시트 + 월말 스냅샷 저장소) ---
+    try:
+        performance_df = performance_history(snapshot)
+
+        # 당월 행이 없으면 (월말 스냅샷만 쌓는 경우) 실시간 전략 값으로 당월 행 추가
+        current_month = ref_date.to_period("M")
+        if performance_df.empty or performance_df["기준일"].max().to_period("M") < current_month:
+            prev_month = performance_df[performance_df["기준일"].dt.to_period("M") == current_month - 1]
+            performance_df = pd.concat([performance_df, performance_rows(ref_date, strategies, prev_month)],
+                                       ignore_index=True)
+
+        performance_df = performance_df.sort_values("기준일", ascending=False)
+        
+        performance_totals = monthly_totals(performance_df)
+        
+    except Exception as e:
+        st.error(f"성과 데이터 로드 실패: {e}")
+        performance_df = pd.DataFrame()
+        performance_totals = pd.DataFrame()
+
+    with trace.span("html:monthly"):
+        monthly_performance_html = build_monthly_performance_html(performance_df, performance_totals, strategies, total_strategy_value)
+
     col_left, col_right = st.columns([1, 1.3])
     with col_left:
         st.markdown(total_value_html, unsafe_allow_html=True)
@@ -1454,11 +1208,88 @@ if selected_tab == "성과":
     if monthly_performance_html:
         st.markdown(monthly_performance_html, unsafe_allow_html=True)
 
+    # --- 일별 평가액 추이 (기준일 재실행 없이 기간 전체를 한 번에) ---
+    with st.expander("일별 평가액 추이"):
+        nav_range = st.date_input(
+            "기간",
+            value=((ref_date - timedelta(days=90)).date(), ref_date.date()),
+            max_value=ref_date.date(),
+            key="nav_range",
+        )
+        if len(nav_range) == 2:
+            with trace.span("nav"):
+                nav_accounts, nav_strategies, nav_failed = cached_nav_report(
+                    snapshot.loaded_at, pd.Timestamp(nav_range[0]), pd.Timestamp(nav_range[1]), snapshot,
+                    tuple(sorted(inputs.all_codes)), tuple(sorted(inputs.us_codes)), snapshot.exchange_rate_sheet,
+                )
+            nav_view = st.radio("구분", ["전략", "계좌"], horizontal=True, key="nav_view")
+            nav_metric = st.selectbox("항목", NAV_COLUMNS, key="nav_metric")
+            nav_frames = nav_strategies if nav_view == "전략" else nav_accounts
+            st.line_chart(pd.DataFrame({name: frame[nav_metric] for name, frame in nav_frames.items()}))
+            if nav_view == "계좌":
+                st.caption("US 계좌는 달러 기준")
+            if nav_failed:
+                st.caption(f"시세 갱신 지연 – 저장된 시세까지만 반영: {', '.join(nav_failed)}")
+
 else:
-    with st.container():
-        col_left, col_right = st.columns([1, 1.2])
-        with col_left:
-            st.markdown(card_html_profit, unsafe_allow_html=True)
-            st.markdown(card_html_balance, unsafe_allow_html=True)
-        with col_right:
-            st.markdown(card_html_stock, unsafe_allow_html=True)
\ No newline at end of file
+    live_graph = [graph]  # 마지막으로 계산한 시세의 그래프 (시세가 그대로면 재사용)
+
+    @st.fragment(run_every=AUTO_REFRESH_INTERVAL if auto_refresh else None)
+    def account_cards():
+        """계좌 탭 카드: 자동 새로고침이면 이 부분만 주기적으로 다시 실행
+        시트·CSS·다른 탭 계산 없이 포지션 표는 이어받고 백그라운드 갱신 표의 시세로 요약만 다시 계산"""
+        global trace
+        tick = bool(fragment_ticks)  # 첫 호출은 전체 재실행 안에서, 이후는 주기 실행
+        fragment_ticks.append(datetime.now())
+        if not tick:
+            tab_summary, tab_df = summary, df_summary
+        else:
+            trace = start_trace()
+            price_map = live_prices(tuple(inputs.all_codes), tuple(inputs.us_codes))
+            tick_graph = live_graph[0].with_prices(price_map)
+            if tick_graph.inputs.key != live_graph[0].inputs.key:
+                live_graph[0] = tick_graph
+            tab_df, tab_summary = live_graph[0].compute("local_total" if acct == "전체" else f"summary:{acct}")
+
+        card_html_profit, card_html_balance, card_html_stock = build_account_cards(tab_df, tab_summary)
+        with st.container():
+            col_left, col_right = st.columns([1, 1.2])
+            with col_left:
+                st.markdown(card_html_profit, unsafe_allow_html=True)
+                st.markdown(card_html_balance, unsafe_allow_html=True)
+            with col_right:
+                st.markdown(card_html_stock, unsafe_allow_html=True)
+
+        if auto_refresh:
+            st.caption(f"자동 새로고침 {fragment_ticks[-1]:%H:%M:%S} · 시세는 {QUOTE_REFRESH_INTERVAL // 60}분마다 갱신")
+        if tick:
+            write_trace(trace.record(tab=f"{acct}:tick", ref_date=f"{ref_date:%Y-%m-%d}"))
+
+    fragment_ticks = []
+    account_cards()
+
+    if acct == "US":
+        fx_split = results["fx_split:US"]
+        st.caption(
+            f"원화 기준 (거래일 환율 원가) · 매입 {fx_split['buy_cost']:,} · 평가 {fx_split['value']:,} · "
+            f"주가손익 {fx_split['price_profit']:+,} · 환손익 {fx_split['fx_profit']:+,}"
+        )
+
+# --- 성능 기록: 재실행마다 JSON lines, 디버그 선택 시 사이드바 패널 ---
+trace_record = trace.record(tab=acct, ref_date=f"{ref_date:%Y-%m-%d}")
+write_trace(trace_record)
+
+if show_trace:
+    with st.sidebar:
+        st.caption(f"재실행 {trace_record['total_s'] * 1000:,.0f} ms")
+        if trace_record["spans"]:
+            spans_df = pd.DataFrame(trace_record["spans"])
+            spans_df["name"] = ["· " * depth + name for depth, name in zip(spans_df["depth"], spans_df["name"])]
+            spans_df["ms"] = (spans_df["duration_s"] * 1000).round(1)
+            st.dataframe(spans_df[["name", "ms"]], hide_index=True, use_container_width=True)
+        st.dataframe(pd.Series(trace_record["counters"], name="횟수", dtype=int), use_container_width=True)
+        if trace_record["fetches"]:
+            fetches_df = pd.DataFrame(trace_record["fetches"])
+            fetches_df["codes"] = fetches_df["codes"].str.join(", ")
+            fetches_df["ms"] = (fetches_df["duration_s"] * 1000).round(1)
+            st.dataframe(fetches_df[["codes", "source", "ms", "ok"]], hide_index=True, use_container_width=True)
\ No newline at end of file
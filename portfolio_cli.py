@@ -0,0 +1,201 @@
+"""포트폴리오 계산 CLI: 기준일의 계좌·전략 요약을 JSON 또는 Parquet으로 출력
+
+대시보드와 같은 계산 코어(portfolio_core)를 화면 없이 실행한다 (배치·크론·벤치마크용).
+시트 연결은 대시보드와 같은 .streamlit/secrets.toml 설정을 사용한다.
+
+    python portfolio_cli.py --ref-date 2026-02-28 --output summary.json
+    python portfolio_cli.py --format parquet --output out/   # accounts / holdings / strategies .parquet
+    python portfolio_cli.py --month-end --write-sheet       # 빠진 월말 성과 추가 (매월 초 크론)
+    python portfolio_cli.py --sync-ledger                   # 시트를 로컬 원장 저장소로 미러링 (크론)
+    python portfolio_cli.py --ledger local                  # 로컬 저장소로 계산 (시트 조회 없음)
+    python portfolio_cli.py --ledger csv:ledger/            # 워크시트별 CSV로 계산
+    python portfolio_cli.py --record tape/                  # 시트·시세 응답을 보관소에 기록
+    python portfolio_cli.py --replay tape/ --cache-dir tmp/ # 네트워크 없이 같은 응답으로 재실행
+
+대시보드는 PORTFOLIO_TAPE_MODE=record|replay, PORTFOLIO_TAPE_DIR 환경 변수로 같은 보관소를,
+PORTFOLIO_LEDGER=gsheets|csv:<디렉터리>|local 로 같은 원장 데이터 소스를 사용한다.
+"""
+import argparse
+import json
+import logging
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+import portfolio_core as core
+
+
+def open_sheet_connection():
+    """gsheets 연결 (Streamlit 서버 없이 생성, 설정은 secrets.toml)"""
+    import streamlit as st
+    from streamlit_gsheets import GSheetsConnection
+    return st.connection("gsheets", type=GSheetsConnection)
+
+def build_report(graph):
+    """계산 그래프 → (요약 dict, 보유 종목 표)"""
+    inputs = graph.inputs
+    accounts = {}
+    holdings = []
+    for acct_name in core.LOCAL_ACCOUNTS + ["US"]:
+        df_summary, summary = graph.compute(f"summary:{acct_name}")
+        accounts[acct_name] = summary
+        if not df_summary.empty:
+            holdings.append(df_summary.assign(계좌명=acct_name))
+
+    overview = graph.compute("strategies")
+    report = {
+        "ref_date": f"{inputs.ref_date:%Y-%m-%d}",
+        "historical": inputs.is_historical,
+        "snapshot_at": inputs.snapshot.loaded_at.isoformat(timespec="seconds"),
+        "exchange_rate": inputs.exchange_rate,
+        "stale_codes": sorted(code for code, quote in inputs.price_map.items() if quote["stale"]),
+        "accounts": accounts,
+        "local_total": graph.compute("local_total")[1],
+        "us_fx_split": graph.compute("fx_split:US"),
+        "strategies": overview["strategies"],
+        "warnings": overview["warnings"],
+    }
+    return report, (pd.concat(holdings, ignore_index=True) if holdings else pd.DataFrame())
+
+def to_builtin(value):
+    """json.dumps 기본 변환: numpy 스칼라 → 파이썬 값"""
+    return value.item() if hasattr(value, "item") else str(value)
+
+def write_json(report, holdings, output):
+    payload = json.dumps(
+        {**report, "holdings": holdings.to_dict(orient="records")},
+        ensure_ascii=False, indent=2, default=to_builtin,
+    )
+    if output:
+        Path(output).write_text(payload, encoding="utf-8")
+    else:
+        print(payload)
+
+def write_parquet(report, holdings, output):
+    """output 디렉터리에 accounts / holdings / strategies .parquet (기준일 열 포함)"""
+    out_dir = Path(output)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    ref_date = pd.Timestamp(report["ref_date"])
+    accounts = pd.DataFrame.from_dict(report["accounts"], orient="index").rename_axis("계좌명").reset_index()
+    tables = {
+        "accounts": accounts,
+        "holdings": holdings,
+        "strategies": pd.DataFrame(report["strategies"]),
+    }
+    for name, table in tables.items():
+        # 종목코드처럼 숫자·문자가 섞여 읽히는 라벨 열은 문자열로 (pyarrow는 혼합 열을 거부)
+        labels = table.select_dtypes(include=["object", "category"]).columns
+        table = table.astype({column: "string" for column in labels})
+        table.assign(기준일=ref_date).to_parquet(out_dir / f"{name}.parquet", index=False)
+
+def write_performance_sheet(conn, snapshot):
+    """성과 시트 + 저장소의 월말 행을 한 번의 update로 기록 (시트 전체 교체)
+    시트에 없는 월이 없으면 기록하지 않음 → 기록한 행 수"""
+    sheet_df = snapshot.sheet("성과")
+    history = core.performance_history(snapshot)
+    if len(history) == len(sheet_df):
+        return 0
+    history = history.sort_values("기준일", kind="stable")
+    history["기준일"] = history["기준일"].dt.strftime("%Y-%m-%d")
+    conn.update(worksheet="성과", data=history)
+    return len(history) - len(sheet_df)
+
+def run_month_end(conn, snapshot, write_sheet):
+    added = core.record_month_ends(snapshot)
+    months = sorted(added["기준일"].dt.strftime("%Y-%m").unique())
+    print(f"월말 성과 추가: {', '.join(months) if months else '없음'}", file=sys.stderr)
+    wrap_rows = added[added["전략"] == core.PERFORMANCE_STRATEGY_NAMES["US Managed WRAP"]]
+    no_wrap = sorted(wrap_rows.loc[wrap_rows["평가액"].isna(), "기준일"].dt.strftime("%Y-%m"))
+    if no_wrap:
+        print(f"WRAP 월별 이력 없음 – US Wrap·Total 비워 둠: {', '.join(no_wrap)}", file=sys.stderr)
+    if write_sheet:
+        print(f"성과 시트 기록: {write_performance_sheet(conn, snapshot)}행", file=sys.stderr)
+
+def run_sync_ledger():
+    """시트 → 로컬 원장 저장소 미러링 (내용이 같은 시트는 건너뜀), 실패한 시트가 있으면 종료 코드 1"""
+    result = core.sync_ledger(open_sheet_connection())
+    failed = {name: value for name, value in result.items() if isinstance(value, Exception)}
+    for name, value in result.items():
+        status = f"실패 {value}" if name in failed else "변경 없음" if value is None else f"{value}행"
+        print(f"{name}: {status}", file=sys.stderr)
+    if failed:
+        sys.exit(1)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ref-date", help="기준일 YYYY-MM-DD (기본: 오늘 = 현재가 기준)")
+    parser.add_argument("--format", choices=["json", "parquet"], default="json")
+    parser.add_argument("--output", help="JSON 파일 또는 Parquet 디렉터리 (JSON 기본: 표준출력)")
+    parser.add_argument("--cache-dir", help="포지션 스냅샷·일봉·원장 저장소 경로 (기본: PORTFOLIO_CACHE_DIR 또는 .cache)")
+    parser.add_argument("--ledger", default=core.LEDGER_BACKEND,
+                        help="원장 데이터 소스 gsheets | csv:<디렉터리> | local (기본: PORTFOLIO_LEDGER 또는 gsheets)")
+    parser.add_argument("--sync-ledger", action="store_true", help="요약 대신 시트를 로컬 원장 저장소로 미러링")
+    parser.add_argument("--trace", action="store_true", help="성능 기록을 trace.jsonl에 추가")
+    tape = parser.add_mutually_exclusive_group()
+    tape.add_argument("--record", metavar="DIR", help="시트 조회·시세 응답을 DIR 보관소에 기록")
+    tape.add_argument("--replay", metavar="DIR",
+                      help="DIR 보관소의 응답만 사용 (시트 연결·네트워크 없음, 깨끗한 --cache-dir 권장)")
+    parser.add_argument("--month-end", action="store_true",
+                        help="요약 대신 빠진 월말 성과를 계산해 로컬 저장소에 추가")
+    parser.add_argument("--write-sheet", action="store_true",
+                        help="--month-end와 함께: 저장소의 월말 행을 성과 시트에 한 번에 기록")
+    args = parser.parse_args(argv)
+
+    if args.format == "parquet" and not args.output:
+        parser.error("--format parquet 에는 --output 디렉터리가 필요합니다")
+    if args.write_sheet and not args.month_end:
+        parser.error("--write-sheet 는 --month-end 와 함께 사용합니다")
+    if args.replay and args.write_sheet:
+        parser.error("--write-sheet 는 --replay 와 함께 사용할 수 없습니다")
+    if args.cache_dir:
+        core.set_cache_dir(args.cache_dir)
+    if args.record:
+        core.set_tape("record", args.record)
+    elif args.replay:
+        core.set_tape("replay", args.replay)
+
+    # 재생 모드의 오늘은 기록한 날짜
+    today = core.current_date()
+    ref_date = pd.Timestamp(args.ref_date) if args.ref_date else today
+    if ref_date > today:
+        parser.error(f"기준일이 오늘 이후입니다: {ref_date:%Y-%m-%d}")
+
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+    if args.sync_ledger:
+        run_sync_ledger()
+        return
+
+    trace = core.start_trace()
+    try:
+        conn = None if core.TAPE_MODE == "replay" else core.open_ledger(args.ledger, open_sheet_connection)
+    except ValueError as e:
+        parser.error(str(e))
+    with trace.span("snapshot"):
+        snapshot = core.build_snapshot(conn)
+    if args.month_end:
+        if args.write_sheet and args.ledger != "gsheets":
+            conn = open_sheet_connection()  # 성과 시트 기록은 항상 원본 시트로
+        run_month_end(conn, snapshot, args.write_sheet)
+        if args.trace:
+            core.write_trace(trace.record(tab="cli:month_end", ref_date=f"{today:%Y-%m-%d}"))
+        return
+
+    graph = core.PortfolioGraph(core.prepare_inputs(snapshot, ref_date, ref_date < today))
+    report, holdings = build_report(graph)
+
+    if args.format == "json":
+        write_json(report, holdings, args.output)
+    else:
+        try:
+            write_parquet(report, holdings, args.output)
+        except ImportError as e:
+            sys.exit(f"Parquet 출력에는 pyarrow가 필요합니다: {e}")
+
+    for message in report["warnings"]:
+        print(f"경고: {message}", file=sys.stderr)
+    if args.trace:
+        core.write_trace(trace.record(tab="cli", ref_date=report["ref_date"]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1925 @@
+"""포트폴리오 계산 코어: 시트 적재, 일봉 저장소·시세, 원장 재생, 기준일 조회, 일별 평가액, 계좌·전략 요약
+
+Streamlit 없이 import 가능하고 import 시 부작용이 없다.
+대시보드(portfolio.py)와 CLI(portfolio_cli.py)가 함께 사용한다.
+"""
+import asyncio
+import concurrent.futures
+import contextlib
+import contextvars
+import functools
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field, replace
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import FinanceDataReader as fdr
+import numpy as np
+import pandas as pd
+import yfinance as yf
+
+
+# --- 기본 설정 ---
+ACCOUNT_NAMES = ["ISA", "Pension", "IRP", "ETF", "US", "사주", "LV"]
+TRADE_SHEET_NAMES = [name for name in ACCOUNT_NAMES if name not in ["LV"]]
+LOCAL_ACCOUNTS = ["ISA", "Pension", "IRP", "ETF"]
+
+# 로컬 캐시 경로 (포지션 스냅샷 등)
+CACHE_DIR = Path(os.environ.get("PORTFOLIO_CACHE_DIR", Path(__file__).parent / ".cache"))
+POSITION_STATE_DIR = CACHE_DIR / "positions"
+PRICE_DB_PATH = CACHE_DIR / "prices.sqlite"
+LEDGER_DB_PATH = CACHE_DIR / "ledger.sqlite"
+
+# 원장 데이터 소스: gsheets | csv:<디렉터리> | local(동기화한 로컬 저장소)
+LEDGER_BACKEND = os.environ.get("PORTFOLIO_LEDGER", "gsheets")
+
+# 기록/재생 보관소: off | record(시트·시세 응답 기록) | replay(보관소로만 응답, 네트워크 없음)
+TAPE_MODE = os.environ.get("PORTFOLIO_TAPE_MODE", "off")
+TAPE_DIR = Path(os.environ.get("PORTFOLIO_TAPE_DIR", CACHE_DIR / "tape"))
+
+PRICE_LOOKBACK_DAYS = 10  # 직전 2거래일 종가 확보용 조회 구간
+FX_CODE = "USD/KRW"       # 일봉 저장소에 종목처럼 저장하는 환율 코드
+
+# 시세 조회 설정
+QUOTE_TTL = 300            # 초, 이 시간 내 갱신된 종목은 재조회 생략
+QUOTE_TIMEOUT = 8          # 초, 갱신 전체 대기 한도 (초과 시 저장된 시세로 응답)
+QUOTE_RETRIES = 2          # 실패 시 재시도 횟수
+QUOTE_BACKOFF = 0.5        # 초, 재시도 대기 (지수 증가)
+QUOTE_CONCURRENCY = {"fdr": 6, "yf": 2}
+QUOTE_CACHE_LIMIT = 20000  # (종목, 구간) 시세 항목 수, 초과 시 비우고 다시 채움
+QUOTE_REFRESH_INTERVAL = 300  # 초, 백그라운드 시세 갱신 주기
+
+SNAPSHOT_TTL = 600  # 초, 시트 스냅샷 유지 시간
+
+# 성능 기록 (재실행마다 JSON 한 줄)
+TRACE_LOG_PATH = CACHE_DIR / "trace.jsonl"
+TRACE_LOG_MAX_BYTES = 5_000_000  # 초과 시 trace.jsonl.1로 교체
+
+# 전략 구성
+STRATEGY_TYPES = {
+    "US Market Index": ["S&P", "나스닥", "TDF"],
+    "US AI Power & Grid": ["전력"],
+}
+STRATEGY_ACCOUNTS = ["ISA", "Pension", "IRP", "US"]
+LV_CAPITAL = 10000000
+
+def set_cache_dir(path):
+    """캐시 경로 변경 (CLI·벤치마크용): 포지션 스냅샷, 일봉·원장 저장소, 성능 기록"""
+    global CACHE_DIR, POSITION_STATE_DIR, PRICE_DB_PATH, LEDGER_DB_PATH, TRACE_LOG_PATH
+    CACHE_DIR = Path(path)
+    POSITION_STATE_DIR = CACHE_DIR / "positions"
+    PRICE_DB_PATH = CACHE_DIR / "prices.sqlite"
+    LEDGER_DB_PATH = CACHE_DIR / "ledger.sqlite"
+    TRACE_LOG_PATH = CACHE_DIR / "trace.jsonl"
+    quote_runtime()["refreshed_at"].clear()
+    quote_runtime()["quotes"].clear()
+    stop_quote_refresher()  # 이전 경로의 갱신기는 종료, 다음 live_prices에서 새로 시작
+
+
+# --- 성능 추적: 실행 1회의 구간별 소요, 캐시 적중, 시세 조회 지연 ---
+class RunTrace:
+    """구간(span)은 메인 스레드에서 중첩 기록, 캐시·조회 기록은 워커 스레드에서도 가능"""
+
+    def __init__(self):
+        self.started_at = datetime.now()
+        self.started = time.perf_counter()
+        self.depth = 0
+        self.spans = []     # {"name", "depth", "start_s", "duration_s"}
+        self.counters = {}  # (캐시, 결과) → 횟수
+        self.fetches = []   # {"codes", "source", "duration_s", "ok"}
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        depth = self.depth
+        self.depth += 1
+        try:
+            yield
+        finally:
+            self.depth = depth
+            self.spans.append({
+                "name": name,
+                "depth": depth,
+                "start_s": round(start - self.started, 4),
+                "duration_s": round(time.perf_counter() - start, 4),
+            })
+
+    def count(self, cache, outcome, n=1):
+        if not n:
+            return
+        with self.lock:
+            self.counters[(cache, outcome)] = self.counters.get((cache, outcome), 0) + n
+
+    def fetch(self, codes, source, duration_s, ok):
+        with self.lock:
+            self.fetches.append({"codes": list(codes), "source": source, "duration_s": round(duration_s, 4), "ok": ok})
+
+    def record(self, **context):
+        with self.lock:
+            return {
+                "ts": self.started_at.isoformat(timespec="seconds"),
+                **context,
+                "total_s": round(time.perf_counter() - self.started, 4),
+                "spans": sorted(self.spans, key=lambda span: span["start_s"]),
+                "counters": {f"{cache}:{outcome}": n for (cache, outcome), n in sorted(self.counters.items())},
+                "fetches": list(self.fetches),
+            }
+
+class NullTrace(RunTrace):
+    """추적을 시작하지 않은 실행용: 아무것도 기록하지 않음"""
+
+    @contextlib.contextmanager
+    def span(self, name):
+        yield
+
+    def count(self, cache, outcome, n=1):
+        pass
+
+    def fetch(self, codes, source, duration_s, ok):
+        pass
+
+_current_trace = contextvars.ContextVar("portfolio_trace", default=NullTrace())
+_trace_log_lock = threading.Lock()
+
+def start_trace():
+    """현재 실행 흐름의 추적을 새로 시작 (Streamlit 재실행·CLI 실행마다 호출)"""
+    trace = RunTrace()
+    _current_trace.set(trace)
+    return trace
+
+def current_trace():
+    return _current_trace.get()
+
+def write_trace(record):
+    """JSON lines로 추가 (실패해도 화면에는 영향 없음)"""
+    try:
+        TRACE_LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
+        with _trace_log_lock:
+            if TRACE_LOG_PATH.exists() and TRACE_LOG_PATH.stat().st_size > TRACE_LOG_MAX_BYTES:
+                TRACE_LOG_PATH.replace(TRACE_LOG_PATH.with_name(TRACE_LOG_PATH.name + ".1"))
+            with open(TRACE_LOG_PATH, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+    except OSError:
+        pass
+
+
+# --- 기록/재생: 시트 조회와 시세 응답을 보관소에 기록하고 그대로 돌려줌 (오프라인 개발·재현 측정) ---
+_tape_lock = threading.Lock()
+
+class TapeMissError(LookupError):
+    """재생 모드에서 보관소에 없는 요청"""
+
+def set_tape(mode, path=None):
+    """기록/재생 모드 변경 (CLI·벤치마크용): mode = off | record | replay"""
+    global TAPE_MODE, TAPE_DIR
+    if mode not in ("off", "record", "replay"):
+        raise ValueError(f"알 수 없는 기록/재생 모드: {mode}")
+    TAPE_MODE = mode
+    if path is not None:
+        TAPE_DIR = Path(path)
+
+def tape_path(kind, key):
+    return TAPE_DIR / kind / f"{hashlib.sha1(repr(key).encode()).hexdigest()}.pkl"
+
+def tape_load(kind, key):
+    try:
+        with open(tape_path(kind, key), "rb") as f:
+            return pickle.load(f)["value"]
+    except FileNotFoundError:
+        raise TapeMissError(f"보관소에 없음: {kind} {key}") from None
+
+def tape_save(kind, key, value):
+    path = tape_path(kind, key)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.stem}.{threading.get_ident()}.tmp")
+    with open(tmp_path, "wb") as f:
+        pickle.dump({"key": key, "value": value}, f)
+    tmp_path.replace(path)
+
+def current_date():
+    """오늘 날짜: 재생 모드면 기록한 날짜 (시세 구간이 기록과 같아 며칠 뒤 재생해도 같은 결과)"""
+    if TAPE_MODE == "replay":
+        try:
+            return tape_load("clock", "today")
+        except TapeMissError:
+            pass
+    return pd.Timestamp(datetime.now().date())
+
+def tape_clock():
+    """기록 모드에서 기록 날짜를 보관소에 남김"""
+    tape_save("clock", "today", pd.Timestamp(datetime.now().date()))
+
+class TapeConnection:
+    """conn.read 대체: record면 원래 연결의 응답을 기록, replay면 보관소에서 응답 (연결 없이도 동작)
+    조회 실패도 기록해 재생 시 같은 예외를 냄"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def read(self, worksheet, ttl=None, **kwargs):
+        key = (worksheet, tuple(sorted(kwargs.items())))
+        if TAPE_MODE == "replay":
+            result = tape_load("sheets", key)
+            if isinstance(result, Exception):
+                raise result
+            return result.copy()
+        try:
+            result = self.conn.read(worksheet=worksheet, ttl=ttl, **kwargs)
+        except Exception as e:
+            tape_save("sheets", key, RuntimeError(f"{type(e).__name__}: {e}"))
+            raise
+        tape_save("sheets", key, result)
+        tape_clock()
+        return result
+
+def taped_closes(source):
+    """download_* 래퍼: record면 받은 종가를 종목별로 보관소에 합쳐 기록,
+    replay면 보관소 종가를 요청 구간으로 잘라 반환 (기록하지 않은 날짜에 재생해도 같은 응답)"""
+    def wrap(downloader):
+        @functools.wraps(downloader)
+        def run(codes, start, end):
+            if TAPE_MODE == "replay":
+                result = {}
+                for code in codes:
+                    try:
+                        closes = tape_load(source, code)
+                    except TapeMissError:
+                        continue
+                    closes = closes[(closes.index >= f"{start:%Y-%m-%d}") & (closes.index <= f"{end:%Y-%m-%d}")]
+                    if not closes.empty:
+                        result[code] = closes
+                return result
+            result = downloader(codes, start, end)
+            if TAPE_MODE == "record":
+                with _tape_lock:
+                    for code, closes in result.items():
+                        try:
+                            closes = closes.combine_first(tape_load(source, code))
+                        except TapeMissError:
+                            pass
+                        tape_save(source, code, closes)
+                    tape_clock()
+            return result
+        return run
+    return wrap
+
+
+# --- 시트 적재 ---
+# 불러올 시트: 이름 -> (워크시트, conn.read 추가 인자)
+SHEET_READS = {
+    "입출금": ("입출금", {}),
+    "WRAP": ("WRAP", {"usecols": [10, 12, 14], "nrows": 1, "header": None}),
+    **{acct: (acct, {}) for acct in TRADE_SHEET_NAMES},
+    "배당": ("배당", {}),
+    "LV": ("LV", {}),
+    "성과": ("성과", {}),
+    "별도예수금": ("입출금", {"usecols": [8], "nrows": 1, "header": None}),
+}
+
+def load_worksheets(conn, reads, initializer=None):
+    """모든 시트를 동시에 조회 → ({이름: DataFrame 또는 예외}, {이름: 소요 초})
+    initializer: 워커 스레드 시작 시 호출 (Streamlit 실행 컨텍스트 연결 등)"""
+
+    def read(item):
+        name, (worksheet, kwargs) = item
+        started = time.perf_counter()
+        try:
+            result = conn.read(worksheet=worksheet, ttl=0, **kwargs)
+        except Exception as e:
+            result = e
+        return name, result, time.perf_counter() - started
+
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=max(len(reads), 1),
+        initializer=initializer,
+    ) as executor:
+        results = list(executor.map(read, reads.items()))
+
+    sheets = {name: result for name, result, _ in results}
+    timings = {name: elapsed for name, _, elapsed in results}
+    return sheets, timings
+
+def sheet_digest(df):
+    """시트 조회 결과의 (행 수, 내용 해시): 열 이름·형식·값이 모두 같아야 같은 값
+    앞쪽 행만 잘라 계산하면 직전 조회 결과와 비교해 행 추가 여부를 판단할 수 있음"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr([(str(col), str(dtype)) for col, dtype in df.dtypes.items()]).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return len(df), digest.hexdigest()
+
+# --- 원장 데이터 소스: 모두 conn.read(worksheet, ...) 형태라 build_snapshot에 그대로 전달 ---
+# probe(worksheet, ...)가 있는 소스는 조회 없이 변경 여부 확인 가능 (같은 값이면 바뀌지 않은 시트)
+class CsvLedger:
+    """워크시트별 CSV 파일 (<디렉터리>/<워크시트>.csv, 시트를 CSV로 내려받은 배치 그대로)
+    헤더 없는 셀 조회(usecols, nrows, header=None)도 시트와 같은 위치로 읽음"""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+
+    def read(self, worksheet, ttl=None, **kwargs):
+        return pd.read_csv(self.directory / f"{worksheet}.csv", **kwargs)
+
+    def probe(self, worksheet, **kwargs):
+        """파일 수정 시각·크기"""
+        try:
+            stat = (self.directory / f"{worksheet}.csv").stat()
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+_ledger_schema_ready = set()  # 스키마를 확인한 저장소 경로 (프로세스당 1회)
+_ledger_schema_lock = threading.Lock()
+
+class LocalLedgerStore:
+    """원본 시트를 미러링한 로컬 저장소 (SQLite, 조회 인자별 DataFrame을 그대로 보관)
+    형식 변환 없이 원본 조회와 같은 결과를 디스크 속도로 반환"""
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else None
+
+    def connect(self):
+        path = self.path or LEDGER_DB_PATH
+        path.parent.mkdir(parents=True, exist_ok=True)
+        db = sqlite3.connect(path, timeout=30)
+        with _ledger_schema_lock:
+            if path not in _ledger_schema_ready:
+                db.execute("PRAGMA journal_mode=WAL")
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS reads (worksheet TEXT, args TEXT, frame BLOB, synced_at TEXT, digest TEXT, "
+                    "PRIMARY KEY (worksheet, args))"
+                )
+                columns = {row[1] for row in db.execute("PRAGMA table_info(reads)")}
+                if "digest" not in columns:  # 내용 해시 열 없이 만든 저장소
+                    db.execute("ALTER TABLE reads ADD COLUMN digest TEXT")
+                _ledger_schema_ready.add(path)
+        return db
+
+    def read(self, worksheet, ttl=None, **kwargs):
+        db = self.connect()
+        try:
+            row = db.execute("SELECT frame FROM reads WHERE worksheet = ? AND args = ?",
+                             (worksheet, json.dumps(kwargs, sort_keys=True))).fetchone()
+        finally:
+            db.close()
+        if row is None:
+            raise LookupError(f"로컬 원장 저장소에 없음: {worksheet} (동기화 필요)")
+        return pickle.loads(row[0])
+
+    def probe(self, worksheet, **kwargs):
+        """저장된 조회 결과의 sheet_digest (없으면 None)"""
+        db = self.connect()
+        try:
+            row = db.execute("SELECT digest FROM reads WHERE worksheet = ? AND args = ?",
+                             (worksheet, json.dumps(kwargs, sort_keys=True))).fetchone()
+        finally:
+            db.close()
+        return tuple(json.loads(row[0])) if row and row[0] else None
+
+    def save(self, reads):
+        """[((워크시트, 조회 인자), DataFrame)] 한 트랜잭션으로 교체"""
+        synced_at = datetime.now().isoformat(timespec="seconds")
+        db = self.connect()
+        try:
+            with db:
+                db.executemany(
+                    "INSERT OR REPLACE INTO reads (worksheet, args, frame, synced_at, digest) VALUES (?, ?, ?, ?, ?)",
+                    [(worksheet, json.dumps(kwargs, sort_keys=True), pickle.dumps(frame), synced_at,
+                      json.dumps(sheet_digest(frame)))
+                     for (worksheet, kwargs), frame in reads],
+                )
+        finally:
+            db.close()
+
+    def synced_at(self):
+        """내용이 바뀐 마지막 동기화 일시 (없으면 None)"""
+        db = self.connect()
+        try:
+            (synced_at,) = db.execute("SELECT MAX(synced_at) FROM reads").fetchone()
+        finally:
+            db.close()
+        return datetime.fromisoformat(synced_at) if synced_at else None
+
+def open_ledger(backend=None, open_sheets=None):
+    """원장 데이터 소스: gsheets(open_sheets()로 연결) | csv:<디렉터리> | local"""
+    backend = backend or LEDGER_BACKEND
+    if backend == "gsheets":
+        return open_sheets()
+    if backend.startswith("csv:"):
+        return CsvLedger(backend[len("csv:"):])
+    if backend == "local":
+        return LocalLedgerStore()
+    raise ValueError(f"알 수 없는 원장 백엔드: {backend}")
+
+def sync_ledger(source, store=None, initializer=None):
+    """원본 시트 → 로컬 저장소 미러링 (조회 실패한 시트는 이전 사본 유지, 내용이 같은 시트는 다시 쓰지 않음)
+    → {이름: 기록한 행 수, 변경 없음은 None, 실패는 예외}"""
+    store = store or LocalLedgerStore()
+    sheets, _ = load_worksheets(source, SHEET_READS, initializer)
+    result = {}
+    changed = []
+    for name, frame in sheets.items():
+        worksheet, kwargs = SHEET_READS[name]
+        if isinstance(frame, Exception):
+            result[name] = frame
+        elif store.probe(worksheet, **kwargs) == sheet_digest(frame):
+            result[name] = None
+        else:
+            result[name] = len(frame)
+            changed.append(((worksheet, kwargs), frame))
+    if changed:
+        store.save(changed)
+    return result
+
+class LedgerSync:
+    """백그라운드 원장 동기화: interval마다 원본 시트를 로컬 저장소로 미러링
+    화면은 로컬 저장소만 읽으므로 시트 조회 지연·호출 제한이 재실행에 더해지지 않음"""
+
+    def __init__(self, source, store=None, interval=SNAPSHOT_TTL):
+        self.source = source
+        self.store = store or LocalLedgerStore()
+        self.interval = interval
+        self.last_result = None
+        self.thread = threading.Thread(target=self.run, name="ledger-sync", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.last_result = sync_ledger(self.source, self.store)
+            except Exception as e:
+                self.last_result = e  # 다음 주기에 재시도, 화면은 마지막 사본을 계속 사용
+
+# 시트별 열 형식 (적재 시 1회 적용): 반복되는 이름은 범주형, 수치는 고정폭, 매수/매도는 불리언
+TRADE_SCHEMA = {
+    "계좌명": "category",
+    "종목코드": "category",
+    "종목명": "category",
+    "유형": "category",
+    "매수": "bool",
+    "수량": "float64",
+    "단가": "float64",
+    "제세금": "float64",
+    "거래금액": "float64",
+    "현재가": "float64",
+}
+CASH_SCHEMA = {"계좌명": "category", "구분": "category", "금액": "float64"}
+DIVIDEND_SCHEMA = {"계좌명": "category", "유형": "category", "배당금": "int64"}
+
+def apply_schema(df, schema):
+    """선언된 열 형식으로 변환 (시트에 없는 열은 건너뜀)"""
+    return df.astype({col: dtype for col, dtype in schema.items() if col in df.columns})
+
+def clean_trade_df(acct, df):
+    df.columns = df.columns.str.strip()
+
+    # ISA, Pension, 사주만 종목코드 특별 처리
+    if acct in ["ISA", "Pension", "사주"]:
+        df['종목코드'] = df['종목코드'].astype(str).str.split('.').str[0].str.zfill(6)
+
+    df["거래일"] = pd.to_datetime(df["거래일"])
+    df["제세금"] = pd.to_numeric(df["제세금"], errors="coerce").fillna(0)
+    df["단가"] = pd.to_numeric(df["단가"], errors="coerce").fillna(0)
+    df["수량"] = pd.to_numeric(df["수량"], errors="coerce").fillna(0)
+    df["거래금액"] = pd.to_numeric(df["거래금액"], errors="coerce").fillna(0)
+    if "현재가" in df.columns:
+        df["현재가"] = pd.to_numeric(df["현재가"], errors="coerce")
+
+    # 유형 열이 있는 경우에만 처리
+    if "유형" in df.columns:
+        df["유형"] = df["유형"].fillna("미분류")
+    else:
+        df["유형"] = "미분류"
+
+    # 구분 → 매수 여부 (매수 외는 매도로 재생)
+    df["매수"] = df["구분"] == "매수"
+    df = df.drop(columns="구분")
+    return apply_schema(df, TRADE_SCHEMA)
+
+@dataclass
+class PortfolioSnapshot:
+    """정제된 시트 데이터 묶음 (탭 전환 등 재실행 시 재사용)"""
+    cash_df: pd.DataFrame
+    trade_dfs: dict
+    df_dividend: pd.DataFrame
+    wrap_capital_usd: float
+    wrap_value_usd: float
+    exchange_rate_sheet: float
+    separate_cash: float
+    sheet_timings: dict
+    loaded_at: datetime
+    optional_sheets: dict = field(default_factory=dict)  # LV, 성과: DataFrame 또는 예외
+    sheet_digests: dict = field(default_factory=dict)    # 시트 이름 -> 조회 결과의 sheet_digest
+    sheet_probes: dict = field(default_factory=dict)     # 시트 이름 -> 소스의 probe 값
+    as_of: object = field(default=None, init=False, repr=False, compare=False)
+
+    def sheet(self, name):
+        """조회/정제에 실패한 선택 시트는 해당 예외를 다시 발생"""
+        result = self.optional_sheets[name]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def as_of_index(self):
+        """기준일 조회 인덱스 (처음 호출 시 생성, 스냅샷 수명 동안 재사용)"""
+        if self.as_of is None:
+            self.as_of = build_as_of_index(self)
+        return self.as_of
+
+def build_snapshot(conn, initializer=None, previous=None):
+    """시트 연결(conn.read 제공 객체) → 정제된 PortfolioSnapshot
+    기록/재생 모드면 보관소를 거쳐 조회 (재생 모드는 conn 없이도 동작)
+    previous: 직전 스냅샷 → 내용이 같은 시트는 정제 결과를 이어받고, 행만 추가된 계좌 시트는 추가분만 정제해 붙임
+    (소스에 probe가 있으면 바뀌지 않은 시트는 조회도 생략)"""
+    if TAPE_MODE != "off":
+        conn = TapeConnection(conn)
+    trace = current_trace()
+
+    probe = getattr(conn, "probe", None)
+    sheet_probes = {name: probe(worksheet, **kwargs) for name, (worksheet, kwargs) in SHEET_READS.items()} if probe else {}
+    kept = {
+        name for name, token in sheet_probes.items()
+        if previous is not None and token is not None
+        and previous.sheet_probes.get(name) == token and name in previous.sheet_digests
+    }
+    sheets, sheet_timings = load_worksheets(
+        conn, {name: read for name, read in SHEET_READS.items() if name not in kept}, initializer,
+    )
+    trace.count("sheet_delta", "probe", len(kept))
+
+    # 조회한 시트: 내용 해시가 직전과 같으면 이어받고, 앞쪽 행이 직전과 같으면 추가분만 정제
+    sheet_digests = {name: previous.sheet_digests[name] for name in kept}
+    appended = {}
+    for name, result in sheets.items():
+        if isinstance(result, Exception):
+            continue
+        sheet_digests[name] = sheet_digest(result)
+        prev_digest = previous.sheet_digests.get(name) if previous is not None else None
+        if prev_digest is None:
+            continue
+        if prev_digest == sheet_digests[name]:
+            kept.add(name)
+            trace.count("sheet_delta", "unchanged")
+        elif name in TRADE_SHEET_NAMES and prev_digest[0] < len(result) \
+                and sheet_digest(result.iloc[:prev_digest[0]]) == prev_digest:
+            appended[name] = prev_digest[0]
+            trace.count("sheet_delta", "appended")
+
+    def take_sheet(name):
+        result = sheets[name]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    # 입출금 시트
+    if "입출금" in kept:
+        cash_df = previous.cash_df
+    else:
+        cash_df = take_sheet("입출금")
+        cash_df.columns = cash_df.columns.str.strip()
+        cash_df["거래일"] = pd.to_datetime(cash_df["거래일"])
+        cash_df["금액"] = pd.to_numeric(cash_df["금액"], errors="coerce")
+        cash_df = apply_schema(cash_df, CASH_SCHEMA)
+
+    # WRAP 시트에서 읽기
+    if "WRAP" in kept:
+        wrap = (previous.wrap_capital_usd, previous.wrap_value_usd, previous.exchange_rate_sheet)
+    else:
+        wrap_df = take_sheet("WRAP")
+        wrap = (float(wrap_df.iloc[0, 0]), float(wrap_df.iloc[0, 1]), float(wrap_df.iloc[0, 2])) \
+            if not wrap_df.empty else (0, 0, 1450)
+
+    # 각 계좌 시트 불러오기 (행 추가분은 정제 후 직전 결과에 붙이고 범주형 다시 적용)
+    trade_dfs = {}
+    for acct in TRADE_SHEET_NAMES:
+        if acct in kept:
+            trade_dfs[acct] = previous.trade_dfs[acct]
+        elif acct in appended:
+            new_rows = clean_trade_df(acct, take_sheet(acct).iloc[appended[acct]:].reset_index(drop=True))
+            trade_dfs[acct] = apply_schema(
+                pd.concat([previous.trade_dfs[acct], new_rows], ignore_index=True), TRADE_SCHEMA,
+            )
+        else:
+            trade_dfs[acct] = clean_trade_df(acct, take_sheet(acct))
+
+    # 배당 시트 불러오기
+    if "배당" in kept:
+        df_dividend = previous.df_dividend
+    else:
+        df_dividend = take_sheet("배당")
+        df_dividend.columns = df_dividend.columns.str.strip()
+        df_dividend["배당금"] = pd.to_numeric(df_dividend["배당금"], errors="coerce").fillna(0)
+        df_dividend = apply_schema(df_dividend, DIVIDEND_SCHEMA)
+
+    # 성과 탭 전용 시트 (실패해도 나머지 탭은 동작)
+    optional_sheets = {name: previous.optional_sheets[name] for name in ["LV", "성과"] if name in kept}
+    if "LV" not in kept:
+        try:
+            lv_df = take_sheet("LV")
+            lv_df.columns = lv_df.columns.str.strip()
+            lv_df["거래일"] = pd.to_datetime(lv_df["거래일"])
+            lv_df["손익"] = pd.to_numeric(lv_df["손익"], errors="coerce")
+            optional_sheets["LV"] = lv_df
+        except Exception as e:
+            optional_sheets["LV"] = e
+
+    if "성과" not in kept:
+        try:
+            performance_df = take_sheet("성과")
+            performance_df.columns = performance_df.columns.str.strip()
+            performance_df["기준일"] = pd.to_datetime(performance_df["기준일"])
+            optional_sheets["성과"] = performance_df
+        except Exception as e:
+            optional_sheets["성과"] = e
+
+    if "별도예수금" in kept:
+        separate_cash = previous.separate_cash
+    else:
+        try:
+            separate_cash_df = take_sheet("별도예수금")
+            separate_cash = float(separate_cash_df.iloc[0, 0]) if not separate_cash_df.empty else 0
+        except:
+            separate_cash = 0
+
+    return PortfolioSnapshot(
+        cash_df=cash_df,
+        trade_dfs=trade_dfs,
+        df_dividend=df_dividend,
+        wrap_capital_usd=wrap[0],
+        wrap_value_usd=wrap[1],
+        exchange_rate_sheet=wrap[2],
+        separate_cash=separate_cash,
+        sheet_timings=sheet_timings,
+        loaded_at=datetime.now(),
+        optional_sheets=optional_sheets,
+        sheet_digests=sheet_digests,
+        sheet_probes=sheet_probes,
+    )
+
+
+# --- 일봉 저장소·시세 ---
+def open_price_store():
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    db = sqlite3.connect(PRICE_DB_PATH, timeout=30)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("CREATE TABLE IF NOT EXISTS bars (code TEXT, date TEXT, close REAL, PRIMARY KEY (code, date))")
+    db.execute("CREATE TABLE IF NOT EXISTS coverage (code TEXT PRIMARY KEY, start TEXT, end TEXT)")
+    return db
+
+def to_close_series(closes):
+    closes = closes.dropna()
+    closes.index = pd.DatetimeIndex(closes.index).strftime("%Y-%m-%d")
+    return closes.astype(float)
+
+@taped_closes("fdr")
+def download_krx_closes(codes, start, end):
+    """FinanceDataReader 일봉 종가 (종목별 조회)"""
+    result = {}
+    for code in codes:
+        data = fdr.DataReader(code, start=start, end=end)
+        if not data.empty:
+            result[code] = to_close_series(data["Close"])
+    return result
+
+@taped_closes("yf")
+def download_us_closes(codes, start, end):
+    """yfinance 일봉 종가 (여러 종목 1회 일괄 조회)"""
+    data = yf.download(list(codes), start=start, end=end + timedelta(days=1),
+                       auto_adjust=True, progress=False, group_by="column", threads=False)
+    if data.empty:
+        return {}
+    closes = data["Close"]
+    if isinstance(closes, pd.Series):
+        closes = closes.to_frame(codes[0])
+    return {code: to_close_series(closes[code]) for code in closes.columns if code in codes}
+
+def refresh_close_histories(codes, start, end, downloader):
+    """저장소에 없는 구간만 원격 조회해 저장 (실패 시 예외)
+    같은 누락 구간의 종목은 downloader 한 번으로 묶어서 조회
+    마지막 저장일이 최근이면 장중 값일 수 있으므로 그날부터 다시 받음"""
+    start_s = f"{start:%Y-%m-%d}"
+    end_s = f"{end:%Y-%m-%d}"
+    recent_s = f"{datetime.now().date() - timedelta(days=1):%Y-%m-%d}"
+
+    db = open_price_store()
+    try:
+        windows = {}
+        for code in codes:
+            covered = db.execute("SELECT start, end FROM coverage WHERE code = ?", (code,)).fetchone()
+            if covered is None:
+                gaps = [(start_s, end_s)]
+            else:
+                cov_start, cov_end = covered
+                gaps = []
+                if start_s < cov_start:
+                    gaps.append((start_s, cov_start))
+                if end_s > cov_end or (end_s == cov_end and cov_end >= recent_s):
+                    gaps.append((cov_end, end_s))
+            for gap in gaps:
+                windows.setdefault(gap, []).append(code)
+
+        for (gap_start, gap_end), gap_codes in windows.items():
+            fetched = downloader(gap_codes, pd.Timestamp(gap_start), pd.Timestamp(gap_end))
+            with db:
+                for code, closes in fetched.items():
+                    if closes.empty:
+                        continue
+                    db.executemany(
+                        "INSERT OR REPLACE INTO bars VALUES (?, ?, ?)",
+                        [(code, date, close) for date, close in closes.items()],
+                    )
+                    db.execute(
+                        "INSERT INTO coverage VALUES (?, ?, ?) ON CONFLICT(code) DO UPDATE "
+                        "SET start = min(start, excluded.start), end = max(end, excluded.end)",
+                        (code, gap_start, gap_end),
+                    )
+    finally:
+        db.close()
+
+def read_close_histories(codes, start, end):
+    """저장소에서 종목별 [start, end] 종가 조회 (네트워크 없음)"""
+    start_s = f"{start:%Y-%m-%d}"
+    end_s = f"{end:%Y-%m-%d}"
+
+    db = open_price_store()
+    try:
+        histories = {}
+        for code in codes:
+            rows = db.execute(
+                "SELECT date, close FROM bars WHERE code = ? AND date BETWEEN ? AND ? ORDER BY date",
+                (code, start_s, end_s),
+            ).fetchall()
+            histories[code] = pd.Series(dict(rows), dtype=float)
+    finally:
+        db.close()
+
+    return histories
+
+def last_two_closes(closes):
+    if closes.empty:
+        return {"current": 0, "prev": 0}
+    current = float(closes.iloc[-1])
+    prev = float(closes.iloc[-2]) if len(closes) >= 2 else current
+    return {"current": current, "prev": prev}
+
+_quote_runtime = None
+_quote_runtime_lock = threading.Lock()
+
+def quote_runtime():
+    """프로세스 공유 (모든 세션): 시세 갱신 스레드 풀, (종목, 구간)별 마지막 갱신 시각,
+    진행 중인 갱신 (single-flight), 종목별 최근 시세"""
+    global _quote_runtime
+    with _quote_runtime_lock:
+        if _quote_runtime is None:
+            _quote_runtime = {
+                "executor": concurrent.futures.ThreadPoolExecutor(max_workers=10),
+                "refreshed_at": {},
+                "lock": threading.Lock(),
+                "inflight": {},  # (종목, 구간) -> Future[성공 여부]
+                "quotes": {},    # (종목, 구간) -> (갱신 시각, 직전 2거래일 종가, 갱신 일시)
+            }
+        return _quote_runtime
+
+def refresh_and_mark(codes, start, end, downloader, window, trace):
+    """워커 스레드에서 실행: 대기 시간이 초과돼도 끝까지 저장소를 갱신"""
+    started = time.perf_counter()
+    try:
+        refresh_close_histories(codes, start, end, downloader)
+    except Exception:
+        trace.fetch(codes, downloader.__name__, time.perf_counter() - started, False)
+        raise
+    trace.fetch(codes, downloader.__name__, time.perf_counter() - started, True)
+    refreshed_at = quote_runtime()["refreshed_at"]
+    now = time.monotonic()
+    for code in codes:
+        refreshed_at[(code, window)] = now
+
+async def refresh_quotes(kr_codes, us_codes, start, end):
+    """소스별 동시성 제한 + 재시도 + 전체 대기 한도 하나
+    갱신하지 못한 종목 집합 반환 (저장된 마지막 시세로 응답)"""
+    loop = asyncio.get_running_loop()
+    executor = quote_runtime()["executor"]
+    limits = {source: asyncio.Semaphore(n) for source, n in QUOTE_CONCURRENCY.items()}
+    window = f"{start:%Y-%m-%d}:{end:%Y-%m-%d}"
+    trace = current_trace()  # 워커 스레드에는 실행 흐름의 추적이 없으므로 직접 전달
+
+    async def refresh(codes, downloader, source):
+        async with limits[source]:
+            for attempt in range(QUOTE_RETRIES + 1):
+                try:
+                    await loop.run_in_executor(executor, refresh_and_mark, codes, start, end, downloader, window, trace)
+                    return set()
+                except Exception:
+                    if attempt < QUOTE_RETRIES:
+                        await asyncio.sleep(QUOTE_BACKOFF * 2 ** attempt)
+        return set(codes)
+
+    jobs = {asyncio.ensure_future(refresh([code], download_krx_closes, "fdr")): [code] for code in kr_codes}
+    if us_codes:
+        jobs[asyncio.ensure_future(refresh(list(us_codes), download_us_closes, "yf"))] = list(us_codes)
+    if not jobs:
+        return set()
+
+    # 한도가 지나면 남은 작업은 모두 stale로 응답: 대기 중인 작업은 취소해 워커를 잡지 않게 하고,
+    # 이미 실행 중인 요청은 백그라운드에서 저장소 갱신을 마침
+    done, pending = await asyncio.wait(jobs, timeout=QUOTE_TIMEOUT)
+    failed = set()
+    for job in pending:
+        job.cancel()
+        failed.update(jobs[job])
+    for job in done:
+        failed |= job.result()
+    return failed
+
+def refresh_due(codes, us_codes, start, end, ttl=QUOTE_TTL):
+    """같은 구간을 TTL 안에 갱신한 종목은 건너뛰고 나머지만 갱신
+    다른 세션이 이미 갱신 중인 종목은 다시 요청하지 않고 그 결과를 기다림 (single-flight)
+    갱신하지 못한 종목 집합 반환"""
+    window = f"{start:%Y-%m-%d}:{end:%Y-%m-%d}"
+    runtime = quote_runtime()
+    refreshed_at = runtime["refreshed_at"]
+    inflight = runtime["inflight"]
+    now = time.monotonic()
+
+    owned = []
+    joined = {}
+    with runtime["lock"]:
+        for code in codes:
+            if now - refreshed_at.get((code, window), -ttl) < ttl:
+                continue
+            future = inflight.get((code, window))
+            if future is None:
+                inflight[(code, window)] = concurrent.futures.Future()
+                owned.append(code)
+            else:
+                joined[code] = future
+
+    trace = current_trace()
+    trace.count("quote_ttl", "hit", len(codes) - len(owned) - len(joined))
+    trace.count("quote_ttl", "miss", len(owned))
+    trace.count("quote_ttl", "joined", len(joined))
+
+    failed = set(owned)
+    try:
+        if owned:
+            failed = asyncio.run(refresh_quotes(
+                [code for code in owned if code not in us_codes],
+                [code for code in owned if code in us_codes],
+                start, end,
+            ))
+    finally:
+        with runtime["lock"]:
+            for code in owned:
+                inflight.pop((code, window)).set_result(code not in failed)
+
+    for code, future in joined.items():
+        try:
+            if not future.result(timeout=QUOTE_TIMEOUT):
+                failed.add(code)
+        except concurrent.futures.TimeoutError:
+            failed.add(code)
+    return failed
+
+def get_all_prices(codes: tuple, us_codes: tuple, ref_date: pd.Timestamp = None, ttl=QUOTE_TTL) -> dict:
+    """stale-while-revalidate: TTL이 지난 종목만 갱신하고, 갱신 실패·지연 종목은
+    저장된 마지막 시세를 stale 표시와 함께 반환 (fetched_at: 마지막 갱신 일시, 없으면 None)"""
+    today = current_date()
+    # 기준일을 주면 그날에서 구간을 끝냄 (어제 기준일·월초 월말 기록도 당일 시세가 섞이지 않게)
+    end = min(ref_date, today) if ref_date is not None else today
+    start = end - timedelta(days=PRICE_LOOKBACK_DAYS)
+
+    stale = refresh_due(codes, us_codes, start, end, ttl)
+
+    # 종목별 시세는 프로세스에서 한 번만 읽고, 갱신 시각이 바뀐 종목만 저장소에서 다시 읽음
+    window = f"{start:%Y-%m-%d}:{end:%Y-%m-%d}"
+    runtime = quote_runtime()
+    quotes = runtime["quotes"]
+    refreshed_at = runtime["refreshed_at"]
+    if len(quotes) > QUOTE_CACHE_LIMIT:
+        quotes.clear()
+    entries = {code: quotes.get((code, window)) for code in codes}
+    stamps = {
+        code: refreshed_at.get((code, window)) for code, entry in entries.items()
+        if entry is None or entry[0] != refreshed_at.get((code, window))
+    }
+    current_trace().count("quote_store", "hit", len(codes) - len(stamps))
+    current_trace().count("quote_store", "miss", len(stamps))
+    if stamps:
+        histories = read_close_histories(list(stamps), start, end)
+        now = time.monotonic()
+        for code, stamp in stamps.items():
+            fetched_at = datetime.now() - timedelta(seconds=now - stamp) if stamp is not None else None
+            entries[code] = quotes[(code, window)] = (stamp, last_two_closes(histories[code]), fetched_at)
+
+    # 구간에 종가가 하나도 없는 종목(재생 보관소에 없는 종목 등)도 0원 시세이므로 stale
+    return {
+        code: {**entries[code][1], "stale": code in stale or not entries[code][1]["current"],
+               "fetched_at": entries[code][2]}
+        for code in codes
+    }
+
+class QuoteRefresher:
+    """백그라운드 시세 갱신: 화면에서 조회한 종목 전체를 주기적으로 갱신해 공유 표에 기록
+    화면은 표를 읽기만 하므로 원격 조회 지연이 재실행 시간에 더해지지 않음"""
+
+    def __init__(self, interval=QUOTE_REFRESH_INTERVAL):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.codes = set()
+        self.us_codes = set()
+        self.table = {}  # 종목 -> {current, prev, stale, fetched_at}
+        self.thread = threading.Thread(target=self.run, name="quote-refresher", daemon=True)
+        self.thread.start()
+
+    def watch(self, codes, us_codes):
+        with self.lock:
+            self.codes.update(codes)
+            self.us_codes.update(us_codes)
+
+    def refresh(self, codes, us_codes, ttl=0):
+        prices = get_all_prices(tuple(codes), tuple(us_codes), ttl=ttl)
+        self.table.update(prices)
+        return prices
+
+    def stop(self, timeout=QUOTE_TIMEOUT):
+        """다음 주기를 기다리지 않고 종료 (진행 중인 갱신은 timeout까지 기다림)"""
+        self.stopping.set()
+        self.thread.join(timeout)
+
+    def run(self):
+        while not self.stopping.wait(self.interval):
+            with self.lock:
+                codes, us_codes = sorted(self.codes), sorted(self.us_codes)
+            if not codes:
+                continue
+            trace = start_trace()
+            try:
+                with trace.span("quote_refresher"):
+                    self.refresh(codes, us_codes)
+            except Exception:
+                continue  # 다음 주기에 재시도, 화면은 마지막 표를 계속 사용
+            write_trace(trace.record(tab="quote_refresher"))
+
+_quote_refresher = None
+
+def quote_refresher():
+    """프로세스 공유 백그라운드 시세 갱신기 (처음 호출 시 시작)"""
+    global _quote_refresher
+    with _quote_runtime_lock:
+        if _quote_refresher is None:
+            _quote_refresher = QuoteRefresher()
+        return _quote_refresher
+
+def stop_quote_refresher():
+    """공유 갱신기 종료 (캐시 경로 변경·테스트 정리용)"""
+    global _quote_refresher
+    with _quote_runtime_lock:
+        refresher, _quote_refresher = _quote_refresher, None
+    if refresher is not None:
+        refresher.stop()
+
+def live_prices(codes, us_codes):
+    """화면용 현재 시세: 백그라운드 갱신 표에서 읽기만 (원격 조회 없음)
+    표에 아직 없는 종목(처음 보는 종목)만 이번 실행에서 조회해 표에 채움"""
+    refresher = quote_refresher()
+    refresher.watch(codes, us_codes)
+    cold = [code for code in codes if code not in refresher.table]
+    current_trace().count("live_quote", "hit", len(codes) - len(cold))
+    current_trace().count("live_quote", "cold", len(cold))
+    if cold:
+        refresher.refresh(cold, [code for code in cold if code in us_codes], ttl=QUOTE_TTL)
+    return {code: refresher.table[code] for code in codes}
+
+def fx_history(start, end):
+    """저장소의 일별 USD/KRW 종가 (누락 구간만 원격 조회, TTL 안의 재실행은 조회 없음)"""
+    refresh_due((FX_CODE,), (), start, end)
+    rates = read_close_histories([FX_CODE], start, end)[FX_CODE]
+    rates.index = pd.to_datetime(rates.index)
+    return rates
+
+def trade_fx_rates(df_trade, rates, fallback_rate):
+    """거래마다 거래일 환율을 붙이는 as-of 조인 (거래일 이전 최근 환율)
+    환율 이력보다 앞선 거래는 첫 환율, 거래일이 없거나 이력이 없으면 fallback_rate"""
+    if rates.empty:
+        return pd.Series(float(fallback_rate), index=df_trade.index)
+    dates = df_trade["거래일"].to_numpy()
+    idx = np.clip(rates.index.searchsorted(dates, side="right") - 1, 0, len(rates) - 1)
+    values = np.where(pd.isna(dates), fallback_rate, rates.to_numpy()[idx])
+    return pd.Series(values, index=df_trade.index)
+
+def krw_ledger(df_trade, rates, fallback_rate):
+    """US 원장의 단가·거래금액·제세금을 거래일 환율로 원화 환산
+    재생하면 평균단가·실현손익이 원화 원가 기준"""
+    fx = trade_fx_rates(df_trade, rates, fallback_rate)
+    df_krw = df_trade.copy()
+    for column in ["단가", "거래금액", "제세금"]:
+        df_krw[column] = df_krw[column] * fx
+    return df_krw
+
+
+# --- 원장 재생·계좌 요약 ---
+def replay_trades(df_trade, positions=None, history=None):
+    """종목코드별 이동평균 재계산: 계좌당 안정 정렬 1회 + 배열 단일 스캔
+    positions가 주어지면 해당 상태에서 이어서 재생 (신규 거래만 전달)
+    history 리스트가 주어지면 거래마다 (종목코드, 거래일, 보유수량, 매입금액, 실현손익 누계, 시트 현재가) 기록"""
+    positions = {} if positions is None else positions
+    if df_trade.empty:
+        return positions
+
+    # 종목코드 → 정수 키 (groupby와 같은 정렬 순서), 코드·거래일 순 안정 정렬
+    code_idx, codes = pd.factorize(df_trade["종목코드"], sort=True)
+    order = np.lexsort((df_trade["거래일"].to_numpy(), code_idx))
+    order = order[code_idx[order] >= 0]
+    if not len(order):
+        return positions
+    code_idx = code_idx[order]
+    codes = codes.tolist()
+
+    # 종목 구간 경계
+    bounds = np.flatnonzero(np.diff(code_idx)) + 1
+    starts = np.concatenate(([0], bounds)).tolist()
+    ends = np.concatenate((bounds, [len(order)])).tolist()
+
+    qtys = df_trade["수량"].to_numpy()[order].tolist()
+    prices = df_trade["단가"].to_numpy()[order].tolist()
+    fees = df_trade["제세금"].to_numpy()[order].tolist()
+    amts = df_trade["거래금액"].to_numpy()[order].tolist()
+    is_buy = df_trade["매수"].to_numpy()[order].tolist()
+    dates = df_trade["거래일"].to_numpy()[order]
+    # 종목명·유형은 종목별 첫 거래 행만 (범주형 열 전체를 풀지 않음)
+    names = df_trade["종목명"].take(order[starts]).tolist()
+    types = df_trade["유형"].take(order[starts]).tolist()
+    if "현재가" in df_trade.columns:
+        sheet_prices = df_trade["현재가"].to_numpy()[order]
+        has_sheet_price = df_trade["현재가"].notna().to_numpy()[order]
+    else:
+        sheet_prices = None
+
+    for k, (start, end) in enumerate(zip(starts, ends)):
+        code = codes[code_idx[start]]
+        prev = positions.get(code)
+        if prev:
+            avg_price = prev["avg_price"]
+            hold_qty = prev["hold_qty"]
+            realized_profit = prev["realized_profit"]
+        else:
+            avg_price = 0
+            hold_qty = 0
+            realized_profit = 0
+        sheet_price = prev["sheet_price"] if prev else 0
+
+        for i in range(start, end):
+            qty = qtys[i]
+            if is_buy[i]:
+                total_cost = avg_price * hold_qty + amts[i] + fees[i]
+                hold_qty += qty
+                avg_price = total_cost / hold_qty if hold_qty != 0 else 0
+            else:
+                realized_profit += (prices[i] - avg_price) * qty - fees[i]
+                hold_qty -= qty
+            if history is not None:
+                if sheet_prices is not None and has_sheet_price[i]:
+                    sheet_price = sheet_prices[i]
+                history.append((code, dates[i], hold_qty, avg_price * hold_qty, realized_profit, sheet_price))
+
+        # 시트 현재가: 해당 종목의 마지막 유효값 (없으면 0)
+        if sheet_prices is not None:
+            valid = np.flatnonzero(has_sheet_price[start:end])
+            if len(valid):
+                sheet_price = sheet_prices[start + valid[-1]]
+
+        positions[code] = {
+            "name": prev["name"] if prev else names[k],
+            "asset_type": prev["asset_type"] if prev else types[k],
+            "hold_qty": hold_qty,
+            "avg_price": avg_price,
+            "realized_profit": realized_profit,
+            "sheet_price": sheet_price,
+            "last_date": dates[end - 1],
+        }
+
+    return positions
+
+LEDGER_COLUMNS = ["종목코드", "종목명", "유형", "거래일", "매수", "수량", "단가", "제세금", "거래금액", "현재가"]
+
+def ledger_fingerprints(df_trade):
+    """행 단위 해시 (재생에 쓰이는 열만)"""
+    cols = [c for c in LEDGER_COLUMNS if c in df_trade.columns]
+    return pd.util.hash_pandas_object(df_trade[cols], index=False).to_numpy()
+
+def ledger_checksum(fingerprints):
+    return hashlib.blake2b(fingerprints.tobytes(), digest_size=16).hexdigest()
+
+def load_positions(state_key, df_trade):
+    """저장된 포지션 스냅샷 이후 추가된 거래만 재생
+    이전 행이 바뀌었거나 과거 일자 거래가 끼어든 경우에만 전체 재생"""
+    path = POSITION_STATE_DIR / f"{state_key}.pkl"
+    fingerprints = ledger_fingerprints(df_trade)
+    n_rows = len(df_trade)
+
+    try:
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+    except Exception:
+        state = None
+
+    positions = None
+    if state and state["n_rows"] <= n_rows:
+        n_prev = state["n_rows"]
+        unchanged = (
+            (n_prev == 0 or fingerprints[n_prev - 1] == state["last_fingerprint"])
+            and ledger_checksum(fingerprints[:n_prev]) == state["checksum"]
+        )
+        if unchanged:
+            if n_prev == n_rows:
+                current_trace().count("position_snapshot", "hit")
+                return state["positions"]
+
+            new_rows = df_trade.iloc[n_prev:]
+            first_dates = new_rows.groupby("종목코드", observed=True)["거래일"].min()
+            in_order = all(
+                code not in state["positions"] or date >= state["positions"][code]["last_date"]
+                for code, date in first_dates.items()
+            )
+            if in_order:
+                current_trace().count("position_snapshot", "incremental")
+                positions = replay_trades(new_rows, {k: dict(v) for k, v in state["positions"].items()})
+
+    if positions is None:
+        current_trace().count("position_snapshot", "miss")
+        positions = replay_trades(df_trade)
+
+    try:
+        POSITION_STATE_DIR.mkdir(parents=True, exist_ok=True)
+        # 세션 스레드·CLI 프로세스가 같은 계좌를 동시에 저장해도 임시 파일이 겹치지 않게
+        tmp_path = path.with_name(f"{path.stem}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, "wb") as f:
+            pickle.dump({
+                "n_rows": n_rows,
+                "checksum": ledger_checksum(fingerprints),
+                "last_fingerprint": fingerprints[-1] if n_rows else None,
+                "positions": positions,
+            }, f)
+        tmp_path.replace(path)
+    except OSError:
+        pass
+
+    return positions
+
+POSITION_COLUMNS = ["계좌명", "종목코드", "종목명", "유형", "보유수량", "평균단가", "실현손익", "시트현재가"]
+
+def position_table(acct_name, df_trade, state_key=None, positions=None):
+    """계좌 원장을 1회 재생한 (계좌명, 종목코드, 유형)별 포지션 표
+    계좌 요약과 전략 집계가 모두 이 표에서 출발 (positions가 주어지면 재생 생략)"""
+    if positions is None:
+        positions = load_positions(state_key, df_trade) if state_key else replay_trades(df_trade)
+    return pd.DataFrame(
+        [
+            [acct_name, code, pos["name"], pos["asset_type"], pos["hold_qty"],
+             pos["avg_price"], pos["realized_profit"], pos["sheet_price"]]
+            for code, pos in positions.items()
+        ],
+        columns=POSITION_COLUMNS,
+    )
+
+def summarize_positions(positions, df_cash, dividend_total, price_map):
+    """포지션 표 (전체 또는 유형 필터링분) → 종목별 평가표 + 요약"""
+    summary_list = []
+    realized_total = 0
+    today_profit = 0
+
+    for code, name, asset_type, hold_qty, avg_price, realized_profit, sheet_price in zip(
+        positions["종목코드"].tolist(), positions["종목명"].tolist(), positions["유형"].tolist(),
+        positions["보유수량"].tolist(), positions["평균단가"].tolist(), positions["실현손익"].tolist(),
+        positions["시트현재가"].tolist(),
+    ):
+        if hold_qty > 0:
+            try:
+                if str(code) == "펀드" or (str(code).endswith(".KS") and price_map.get(str(code), {}).get("current", 0) == 0):
+                    current_price = sheet_price
+                    prev_close = current_price
+                else:
+                    price_info = price_map.get(str(code), {"current": 0, "prev": 0})
+                    current_price = price_info["current"]
+                    prev_close = price_info["prev"]
+            except:
+                current_price = 0
+                prev_close = 0
+
+            current_value = current_price * hold_qty
+            buy_cost = avg_price * hold_qty
+            profit = current_value - buy_cost
+            profit_rate = profit / buy_cost * 100 if buy_cost else 0
+            today_profit += (current_price - prev_close) * hold_qty 
+
+            summary_list.append({
+                "종목코드": code,
+                "종목명": name,
+                "유형": asset_type,
+                "보유수량": hold_qty,
+                "평균단가": round(avg_price),
+                "현재가": round(current_price),
+                "평가금액": round(current_value),
+                "매입금액": round(buy_cost),
+                "평가손익": round(profit),
+                "수익률(%)": round(profit_rate, 2)
+            })
+
+        realized_total += realized_profit
+
+    df_summary = pd.DataFrame(summary_list)
+
+    # 빈 DataFrame 처리
+    if df_summary.empty:
+        current_value = 0
+        current_profit = 0
+    else:
+        current_value = df_summary["평가금액"].sum()
+        current_profit = df_summary["평가손익"].sum()
+
+    # 계산된 값들의 NaN 처리
+    capital = (df_cash[df_cash["구분"] == "입금"]["금액"].sum() - df_cash[df_cash["구분"] == "출금"]["금액"].sum())
+    capital = capital if pd.notna(capital) else 0
+    
+    actual_profit = realized_total + dividend_total
+    actual_profit = actual_profit if pd.notna(actual_profit) else 0
+    
+    total_balance = capital + current_profit + actual_profit
+    cash = total_balance - current_value
+    total_profit_rate = (total_balance - capital) / capital * 100 if capital else 0
+
+    summary = {
+        "capital": round(capital) if pd.notna(capital) else 0,
+        "current_value": round(current_value) if pd.notna(current_value) else 0,
+        "current_profit": round(current_profit) if pd.notna(current_profit) else 0,
+        "actual_profit": round(actual_profit) if pd.notna(actual_profit) else 0,
+        "total_balance": round(total_balance) if pd.notna(total_balance) else 0,
+        "cash": round(cash) if pd.notna(cash) else 0,
+        "total_profit": round(current_profit + actual_profit + dividend_total) if pd.notna(current_profit + actual_profit + dividend_total) else 0,
+        "total_profit_rate": round(total_profit_rate, 2) if pd.notna(total_profit_rate) else 0,
+        "today_profit": round(today_profit) if pd.notna(today_profit) else 0
+    }
+
+    return df_summary, summary
+
+def account_dividend_total(df_trade, df_dividend):
+    # 배당금 계산 - NaN 처리 추가
+    dividend_total = 0
+    if not df_trade.empty and "계좌명" in df_trade.columns:
+        account_names = df_trade["계좌명"].unique()
+        dividend_sum = df_dividend[df_dividend["계좌명"].isin(account_names)]["배당금"].sum()
+        dividend_total = dividend_sum if pd.notna(dividend_sum) else 0
+    return dividend_total
+
+def calculate_account_summary(df_trade, df_cash, df_dividend, price_map, is_us_stock=False, state_key=None, positions=None):
+    if positions is None:
+        acct_name = df_trade["계좌명"].iloc[0] if not df_trade.empty and "계좌명" in df_trade.columns else ""
+        positions = position_table(acct_name, df_trade, state_key)
+    return summarize_positions(positions, df_cash, account_dividend_total(df_trade, df_dividend), price_map)
+
+
+# --- 기준일 조회: 거래일 정렬본 이진 탐색 + 월말 체크포인트 ---
+@dataclass
+class LedgerCheckpoints:
+    """거래일 순으로 정렬한 계좌 원장과 매월 말 누적 포지션 상태"""
+    df_trade: pd.DataFrame
+    rows: np.ndarray  # 각 체크포인트까지의 행 수 (오름차순)
+    states: list      # 체크포인트 시점의 positions
+
+    def ledger_as_of(self, ref_date):
+        return self.df_trade.iloc[:self.df_trade["거래일"].searchsorted(ref_date, side="right")]
+
+    def positions_as_of(self, ref_date):
+        """직전 체크포인트 상태에서 기준일까지의 거래만 이어서 재생"""
+        n_rows = self.df_trade["거래일"].searchsorted(ref_date, side="right")
+        k = np.searchsorted(self.rows, n_rows, side="right") - 1
+        if k < 0:
+            return replay_trades(self.df_trade.iloc[:n_rows])
+        # 재생은 종목별 상태를 새 dict로 교체하므로 바깥 dict만 복사
+        return replay_trades(self.df_trade.iloc[self.rows[k]:n_rows], dict(self.states[k]))
+
+def build_checkpoints(df_trade):
+    df_sorted = df_trade[df_trade["거래일"].notna()].sort_values("거래일", kind="stable")
+    dates = df_sorted["거래일"]
+    if dates.empty:
+        return LedgerCheckpoints(df_sorted, np.array([], dtype=int), [])
+
+    # 매월 1일 이전까지의 행 수 = 전월 말 체크포인트
+    month_starts = pd.date_range(dates.iloc[0], dates.iloc[-1], freq="MS")
+    rows = dates.searchsorted(month_starts, side="left")
+
+    states = []
+    positions = {}
+    prev_rows = 0
+    for n_rows in rows:
+        positions = replay_trades(df_sorted.iloc[prev_rows:n_rows], dict(positions))
+        states.append(positions)
+        prev_rows = n_rows
+    return LedgerCheckpoints(df_sorted, rows, states)
+
+@dataclass
+class AsOfIndex:
+    """기준일 조회용 인덱스: 입출금·배당 정렬본 + 계좌별 원장 체크포인트"""
+    cash_df: pd.DataFrame
+    df_dividend: pd.DataFrame
+    dividend_dates: pd.Series  # 배당일 열이 없으면 None
+    ledgers: dict
+
+    def cash_as_of(self, ref_date):
+        return self.cash_df.iloc[:self.cash_df["거래일"].searchsorted(ref_date, side="right")]
+
+    def dividend_as_of(self, ref_date):
+        if self.dividend_dates is None:
+            return self.df_dividend
+        return self.df_dividend.iloc[:self.dividend_dates.searchsorted(ref_date, side="right")]
+
+def build_as_of_index(snapshot):
+    """스냅샷마다 한 번 생성, 기준일 변경은 이진 탐색 + 짧은 재생으로 응답"""
+    cash_df = snapshot.cash_df
+    cash_df = cash_df[cash_df["거래일"].notna()].sort_values("거래일", kind="stable")
+
+    df_dividend = snapshot.df_dividend
+    dividend_dates = None
+    if "배당일" in df_dividend.columns:
+        parsed = pd.to_datetime(df_dividend["배당일"])
+        order = parsed[parsed.notna()].sort_values(kind="stable").index
+        df_dividend = df_dividend.loc[order]
+        dividend_dates = parsed.loc[order]
+
+    return AsOfIndex(
+        cash_df=cash_df,
+        df_dividend=df_dividend,
+        dividend_dates=dividend_dates,
+        ledgers={name: build_checkpoints(df) for name, df in snapshot.trade_dfs.items()},
+    )
+
+
+# --- 일별 평가액 시계열: (날짜 × 종목) 보유 행렬 × (날짜 × 종목) 종가 행렬 ---
+NAV_COLUMNS = ["평가금액", "매입금액", "평가손익", "실현손익"]
+
+def position_matrices(df_trade, dates):
+    """원장 1회 재생 상태를 (날짜 × 종목코드) 행렬로: 보유수량, 매입금액, 실현손익 누계, 시트 현재가
+    같은 날 여러 거래는 마지막 상태, 거래 없는 날은 직전 상태 유지"""
+    history = []
+    positions = replay_trades(df_trade, history=history)
+    states = pd.DataFrame(history, columns=["종목코드", "거래일", "보유수량", "매입금액", "실현손익", "시트현재가"])
+    states = states[states["거래일"].notna()].drop_duplicates(["거래일", "종목코드"], keep="last")
+    states = states.set_index(["거래일", "종목코드"])
+
+    matrices = {}
+    for column in ["보유수량", "매입금액", "실현손익", "시트현재가"]:
+        matrix = states[column].unstack("종목코드")
+        matrix = matrix.reindex(matrix.index.union(dates)).ffill().reindex(dates).fillna(0)
+        matrices[column] = matrix
+    return matrices, positions
+
+def nav_frame(matrices, closes):
+    """보유 행렬 × 종가 행렬 → 일별 평가금액·매입금액·평가손익·실현손익
+    계좌 요약처럼 보유수량 > 0 인 종목만 평가하고, 종가가 없는 종목(펀드 등)은 그날까지의 시트 현재가로 평가"""
+    hold_qty = matrices["보유수량"]
+    held = hold_qty > 0
+    cost = matrices["매입금액"].where(held, 0)
+    # 시트에서 정수로 읽힌 종목코드도 시세 조회처럼 문자열로 맞춤
+    prices = closes.reindex(columns=hold_qty.columns.astype(str)).set_axis(hold_qty.columns, axis=1)
+    prices = prices.fillna(matrices["시트현재가"])
+    value = (hold_qty * prices).where(held, 0)
+
+    frame = pd.DataFrame({
+        "평가금액": value.sum(axis=1),
+        "매입금액": cost.sum(axis=1),
+        "실현손익": matrices["실현손익"].sum(axis=1),
+    })
+    frame["평가손익"] = frame["평가금액"] - frame["매입금액"]
+    return frame[NAV_COLUMNS]
+
+def nav_timeseries(trade_dfs, accounts, closes, fx_rates, us_krw_trades=None):
+    """계좌별·전략별 일별 시계열 (계좌당 재생 1회 + 행렬 곱)
+    closes: (날짜 × 종목코드) 종가, fx_rates: 날짜별 USD/KRW
+    전략 합산 시 US 계좌는 원화 환산: us_krw_trades(거래일 환율 원장)가 있으면 원화 원가,
+    없으면 달러 원가에 당일 환율"""
+    by_account = {}
+    strategy_frames = {name: [] for name in STRATEGY_TYPES}
+
+    for acct_name in accounts:
+        matrices, positions = position_matrices(trade_dfs[acct_name], closes.index)
+        by_account[acct_name] = nav_frame(matrices, closes)
+        if acct_name not in STRATEGY_ACCOUNTS:
+            continue
+
+        prices = closes
+        multiplier = 1
+        if acct_name == "US" and us_krw_trades is not None:
+            matrices, positions = position_matrices(us_krw_trades, closes.index)
+            matrices["시트현재가"] = matrices["시트현재가"].mul(fx_rates, axis=0)
+            prices = closes.mul(fx_rates, axis=0)
+        elif acct_name == "US":
+            multiplier = fx_rates
+
+        for name, types in STRATEGY_TYPES.items():
+            codes = [code for code in matrices["보유수량"].columns if positions[code]["asset_type"] in types]
+            frame = nav_frame({key: matrix[codes] for key, matrix in matrices.items()}, prices)
+            strategy_frames[name].append(frame.mul(multiplier, axis=0))
+
+    by_strategy = {name: sum(frames) for name, frames in strategy_frames.items() if frames}
+    if "ETF" in by_account:
+        by_strategy["KR Sector ETFs"] = by_account["ETF"]
+    return by_account, by_strategy
+
+def load_close_matrix(codes, us_codes, start, end):
+    """(영업일 × 종목코드) 종가 행렬: 저장소의 누락 구간만 원격 조회, 휴장일은 직전 종가
+    갱신하지 못한 종목 집합도 함께 반환"""
+    fetch_start = start - timedelta(days=PRICE_LOOKBACK_DAYS)
+    failed = refresh_due(codes, us_codes, fetch_start, end)
+
+    histories = read_close_histories(codes, fetch_start, end)
+    closes = pd.DataFrame({code: closes for code, closes in histories.items()}, columns=list(codes))
+    closes.index = pd.to_datetime(closes.index)
+    dates = pd.bdate_range(start, end)
+    closes = closes.reindex(closes.index.union(dates)).ffill().reindex(dates)
+    return closes, failed
+
+def nav_report(snapshot, start, end, codes, us_codes, fallback_rate):
+    """기간 [start, end]의 계좌별·전략별 일별 시계열 + 시세 갱신 실패 종목"""
+    closes, failed = load_close_matrix(codes + (FX_CODE,), us_codes, start, end)
+    fx_rates = closes.pop(FX_CODE).fillna(fallback_rate)
+
+    df_us = snapshot.trade_dfs["US"]
+    first_date = df_us["거래일"].min()
+    trade_rates = fx_history(first_date - timedelta(days=PRICE_LOOKBACK_DAYS), end) \
+        if pd.notna(first_date) else pd.Series(dtype=float)
+    by_account, by_strategy = nav_timeseries(snapshot.trade_dfs, LOCAL_ACCOUNTS + ["US"], closes, fx_rates,
+                                             us_krw_trades=krw_ledger(df_us, trade_rates, fallback_rate))
+    return by_account, by_strategy, sorted(failed)
+
+
+# --- 계산 입력: 스냅샷 + 기준일 → 기준일 슬라이스, 시세, 환율 ---
+@dataclass
+class PortfolioInputs:
+    """기준일 하나의 계산 입력 (계산 그래프가 읽는 값 전부)"""
+    snapshot: PortfolioSnapshot
+    ref_date: pd.Timestamp
+    is_historical: bool
+    cash_df: pd.DataFrame
+    trade_dfs: dict
+    df_dividend: pd.DataFrame
+    all_codes: set
+    us_codes: set
+    price_map: dict
+    exchange_rate: float
+
+    @property
+    def key(self):
+        """스냅샷 시각, 기준일, 환율, 시세 중 하나라도 바뀌면 달라지는 메모 키"""
+        return (
+            self.snapshot.loaded_at,
+            self.ref_date,
+            self.exchange_rate,
+            tuple(sorted((code, quote["current"], quote["prev"]) for code, quote in self.price_map.items())),
+        )
+
+def price_universe(trade_dfs):
+    """시세 조회 대상 종목코드 (전체, US)"""
+    all_codes = set()
+    us_codes = set()
+    for acct_name in LOCAL_ACCOUNTS + ["US"]:
+        df_t = trade_dfs[acct_name]
+        codes = df_t["종목코드"].astype(str).unique()
+        all_codes.update(codes)
+        if acct_name == "US":
+            us_codes.update(codes)
+    all_codes.discard("펀드")
+    us_codes.discard("펀드")
+    return all_codes, us_codes
+
+def prepare_inputs(snapshot, ref_date, is_historical, live=False):
+    """스냅샷 + 기준일 → 계산 입력 (기준일이면 원장·입출금·배당을 기준일까지 자르고 당시 시세·환율 사용)
+    live: 현재 시세를 백그라운드 갱신 표에서 읽기 (대시보드용)"""
+    trace = current_trace()
+
+    # 스냅샷 객체는 재실행 간 공유되므로 계좌 dict만 복사해서 사용 (기준일 필터링 등)
+    cash_df = snapshot.cash_df
+    trade_dfs = dict(snapshot.trade_dfs)
+    df_dividend = snapshot.df_dividend
+    all_codes, us_codes = price_universe(trade_dfs)
+
+    # 기준일 필터링: 정렬본의 앞부분 슬라이스 (포지션은 월말 체크포인트에서 이어서 재생)
+    if is_historical:
+        with trace.span("as_of_index"):
+            as_of = snapshot.as_of_index()
+        cash_df = as_of.cash_as_of(ref_date)
+        for acct_name in TRADE_SHEET_NAMES:
+            trade_dfs[acct_name] = as_of.ledgers[acct_name].ledger_as_of(ref_date)
+        df_dividend = as_of.dividend_as_of(ref_date)
+
+    # 한 번에 병렬 조회
+    with trace.span("prices"):
+        if live and not is_historical:
+            price_map = live_prices(tuple(all_codes), tuple(us_codes))
+        else:
+            price_map = get_all_prices(tuple(all_codes), tuple(us_codes), ref_date=ref_date if is_historical else None)
+
+    # 환율: 현재는 WRAP 시트 값, 기준일은 저장소의 일별 USD/KRW (누락 구간만 원격 조회)
+    if is_historical:
+        with trace.span("fx"):
+            fx_recent = fx_history(ref_date - timedelta(days=PRICE_LOOKBACK_DAYS), ref_date)
+        exchange_rate = float(fx_recent.iloc[-1]) if not fx_recent.empty else snapshot.exchange_rate_sheet
+    else:
+        exchange_rate = snapshot.exchange_rate_sheet
+
+    return PortfolioInputs(
+        snapshot=snapshot,
+        ref_date=ref_date,
+        is_historical=is_historical,
+        cash_df=cash_df,
+        trade_dfs=trade_dfs,
+        df_dividend=df_dividend,
+        all_codes=all_codes,
+        us_codes=us_codes,
+        price_map=price_map,
+        exchange_rate=exchange_rate,
+    )
+
+
+# --- 계산 그래프: 필요한 결과만 계산, 같은 입력이면 메모에서 재사용 ---
+class PortfolioGraph:
+    """memo: 외부에서 넘기면 그 dict에 결과를 쌓음 (대시보드는 session_state에 보관)"""
+
+    def __init__(self, inputs, memo=None):
+        self.inputs = inputs
+        self.memo = {} if memo is None else memo
+
+    def compute(self, name):
+        trace = current_trace()
+        if name in self.memo:
+            trace.count("compute", "hit")
+        else:
+            trace.count("compute", "miss")
+            with trace.span(f"compute:{name}"):
+                self.memo[name] = COMPUTE_NODES[name](self)
+        return self.memo[name]
+
+    def with_prices(self, price_map):
+        """시세만 바꾼 그래프: 시세와 무관한 포지션 표(positions*)는 이어받고 나머지만 다시 계산"""
+        memo = {name: value for name, value in self.memo.items() if name in PRICE_INDEPENDENT_NODES}
+        return PortfolioGraph(replace(self.inputs, price_map=price_map), memo)
+
+def positions_node(graph, acct_name):
+    """현재: 저장된 포지션 스냅샷 이후 거래만 재생 / 기준일: 월말 체크포인트 이후 거래만 재생"""
+    inputs = graph.inputs
+    if inputs.is_historical:
+        return position_table(acct_name, inputs.trade_dfs[acct_name],
+                              positions=inputs.snapshot.as_of_index().ledgers[acct_name].positions_as_of(inputs.ref_date))
+    return position_table(acct_name, inputs.trade_dfs[acct_name], state_key=acct_name)
+
+def us_krw_positions_node(graph):
+    """US 원장을 거래일 환율로 원화 환산해 재생한 포지션 표 (평균단가·실현손익이 원화 원가)
+    시트현재가(달러)는 시세가 없을 때 원화 시세 대신 쓰이므로 현재 환율로 환산"""
+    inputs = graph.inputs
+    df_trade = inputs.trade_dfs["US"]
+    first_date = df_trade["거래일"].min()
+    rates = fx_history(first_date - timedelta(days=PRICE_LOOKBACK_DAYS), inputs.ref_date) \
+        if pd.notna(first_date) else pd.Series(dtype=float)
+    positions = position_table("US", krw_ledger(df_trade, rates, inputs.exchange_rate),
+                               state_key=None if inputs.is_historical else "US_krw")
+    return positions.assign(시트현재가=positions["시트현재가"] * inputs.exchange_rate)
+
+def us_fx_split_node(graph):
+    """US 보유분 원화 평가손익 = 주가손익(현재 환율 환산) + 환손익(매수일 대비 환율 변동)"""
+    inputs = graph.inputs
+    positions = graph.compute("positions:US")
+    held = positions[positions["보유수량"] > 0]
+    avg_krw = held["종목코드"].map(graph.compute("positions_krw:US").set_index("종목코드")["평균단가"])
+    current = held["종목코드"].map({code: quote["current"] for code, quote in inputs.price_map.items()}).fillna(0)
+    hold_qty = held["보유수량"]
+
+    buy_cost_krw = (hold_qty * avg_krw).sum()
+    price_profit = (hold_qty * (current - held["평균단가"])).sum() * inputs.exchange_rate
+    fx_profit = (hold_qty * (held["평균단가"] * inputs.exchange_rate - avg_krw)).sum()
+    return {
+        "buy_cost": round(buy_cost_krw),
+        "value": round(buy_cost_krw + price_profit + fx_profit),
+        "price_profit": round(price_profit),
+        "fx_profit": round(fx_profit),
+    }
+
+def calculate_strategy_by_type(graph, type_filter):
+    """계좌별 포지션 표(재생 1회, 계좌 요약과 공유)에서 유형별로 집계
+    US는 거래일 환율 원화 원장 기준 (매입금액·실현손익 원화, 평가금액은 현재 환율)"""
+    value = 0
+    current_profit = 0
+    actual_profit = 0
+    buy_cost = 0
+    types = type_filter if isinstance(type_filter, list) else [type_filter]
+    inputs = graph.inputs
+    cash_df, df_dividend, price_map, exchange_rate = inputs.cash_df, inputs.df_dividend, inputs.price_map, inputs.exchange_rate
+    krw_price_map = {
+        code: {"current": quote["current"] * exchange_rate, "prev": quote["prev"] * exchange_rate}
+        for code, quote in price_map.items()
+    }
+
+    for acct_name in STRATEGY_ACCOUNTS:
+        is_us = acct_name == "US"
+        positions = graph.compute("positions_krw:US" if is_us else f"positions:{acct_name}")
+        positions = positions[positions["유형"].isin(types)]
+        df_cash = cash_df[cash_df["계좌명"] == acct_name]
+
+        dividend_filtered = df_dividend[
+            (df_dividend["계좌명"] == acct_name) & df_dividend["유형"].isin(types)
+        ]
+        dividend_sum = dividend_filtered["배당금"].sum() if not dividend_filtered.empty else 0
+        dividend_total = dividend_sum if pd.notna(dividend_sum) else 0
+        if is_us:
+            dividend_total *= exchange_rate
+
+        if not positions.empty:
+            df_s, s = summarize_positions(positions, df_cash, dividend_total, krw_price_map if is_us else price_map)
+            if not df_s.empty:
+                value += df_s["평가금액"].sum()
+                current_profit += df_s["평가손익"].sum()
+                buy_cost += df_s["매입금액"].sum()
+                actual_profit += s["actual_profit"]
+
+    profit = current_profit + actual_profit
+    return_rate = (profit / buy_cost * 100) if buy_cost > 0 else 0
+
+    return {
+        "value": int(value),
+        "current_profit": int(current_profit),
+        "actual_profit": int(actual_profit),
+        "buy_cost": int(buy_cost),
+        "profit": int(profit),
+        "return": round(return_rate, 1)
+    }
+
+def account_summary_node(graph, acct_name):
+    inputs = graph.inputs
+    df_trade = inputs.trade_dfs[acct_name]
+    df_cash = inputs.cash_df[inputs.cash_df["계좌명"] == acct_name]
+    return calculate_account_summary(df_trade, df_cash, inputs.df_dividend, inputs.price_map, is_us_stock=(acct_name == "US"),
+                                     positions=graph.compute(f"positions:{acct_name}"))
+
+def local_total_node(graph):
+    local_total_summary = {
+        "capital": 0,
+        "current_value": 0,
+        "current_profit": 0,
+        "actual_profit": 0,
+        "total_balance": 0,
+        "cash": 0,
+        "today_profit": 0,
+    }
+    df_summary_list = []
+
+    for acct_name in LOCAL_ACCOUNTS:
+        df_s, s = graph.compute(f"summary:{acct_name}")
+        df_summary_list.append(df_s)
+        for key in local_total_summary:
+            local_total_summary[key] += s[key]
+
+    local_total_summary["total_profit_rate"] = (
+        (local_total_summary["total_balance"] - local_total_summary["capital"]) / local_total_summary["capital"] * 100
+        if local_total_summary["capital"] else 0
+    )
+
+    local_summary = {k: round(v) if k != "total_profit_rate" else round(v, 2) for k, v in local_total_summary.items()}
+    return pd.concat(df_summary_list, ignore_index=True), local_summary
+
+def strategy_summaries(graph):
+    """성과 탭 전략 5종 (평가액·손익·수익률·비중) + 경고 (LV 시트 실패 시 0으로 대체)"""
+    inputs = graph.inputs
+    snapshot = inputs.snapshot
+    exchange_rate = inputs.exchange_rate
+    warnings = []
+
+    strategy_1 = graph.compute("strategy:us_market")
+    strategy_2 = graph.compute("strategy:us_ai")
+
+    wrap_value_usd = snapshot.wrap_value_usd
+    wrap_capital_usd = snapshot.wrap_capital_usd
+    wrap_value = wrap_value_usd * exchange_rate
+    wrap_profit = (wrap_value_usd - wrap_capital_usd) * exchange_rate
+    wrap_return = ((wrap_value_usd - wrap_capital_usd) / wrap_capital_usd * 100) if wrap_capital_usd > 0 else 0
+
+    try:
+        lv_df = snapshot.sheet("LV")
+        if inputs.is_historical:
+            lv_df = lv_df[lv_df["거래일"] <= inputs.ref_date]
+        lv_profit = lv_df["손익"].sum()
+
+        lv_value = lv_profit + LV_CAPITAL
+        lv_return = (lv_profit / LV_CAPITAL * 100) if LV_CAPITAL > 0 else 0
+    except Exception as e:
+        warnings.append(f"LV 데이터 로드 실패: {e}")
+        lv_value = 0
+        lv_profit = 0
+        lv_return = 0
+
+    _, s_etf = graph.compute("summary:ETF")
+
+    etf_value = s_etf["current_value"]
+    etf_profit = s_etf["current_profit"] + s_etf["actual_profit"]
+    etf_return = s_etf["total_profit_rate"]
+
+    strategies = [
+        {"name": "US Market Index",    "value": int(strategy_1["value"]), "profit": int(strategy_1["profit"]), "rate": round(strategy_1["return"], 1), "current_profit": int(strategy_1["current_profit"]), "actual_profit": int(strategy_1["actual_profit"])},
+        {"name": "US AI Power & Grid", "value": int(strategy_2["value"]), "profit": int(strategy_2["profit"]), "rate": round(strategy_2["return"], 1), "current_profit": int(strategy_2["current_profit"]), "actual_profit": int(strategy_2["actual_profit"])},
+        {"name": "US Managed WRAP",    "value": int(wrap_value),          "profit": int(wrap_profit),          "rate": round(wrap_return, 1),          "current_profit": int(wrap_profit), "actual_profit": 0},
+        {"name": "KR Index Leverage",  "value": int(lv_value),            "profit": int(lv_profit),            "rate": round(lv_return, 1),            "current_profit": 0,   "actual_profit": int(lv_profit)},
+        {"name": "KR Sector ETFs",     "value": int(etf_value),           "profit": int(etf_profit),           "rate": round(etf_return, 1),           "current_profit": int(s_etf["current_profit"]), "actual_profit": int(s_etf["actual_profit"])},
+    ]
+
+    total_strategy_value = sum(s["value"] for s in strategies)
+    for strategy in strategies:
+        strategy["weight"] = round((strategy["value"] / total_strategy_value * 100), 1) if total_strategy_value > 0 else 0
+    return {"strategies": strategies, "warnings": warnings}
+
+COMPUTE_NODES = {
+    **{f"positions:{name}": (lambda graph, name=name: positions_node(graph, name)) for name in LOCAL_ACCOUNTS + ["US"]},
+    **{f"summary:{name}": (lambda graph, name=name: account_summary_node(graph, name)) for name in LOCAL_ACCOUNTS + ["US"]},
+    "positions_krw:US": us_krw_positions_node,
+    "fx_split:US": us_fx_split_node,
+    "local_total": local_total_node,
+    "strategy:us_market": lambda graph: calculate_strategy_by_type(graph, STRATEGY_TYPES["US Market Index"]),
+    "strategy:us_ai": lambda graph: calculate_strategy_by_type(graph, STRATEGY_TYPES["US AI Power & Grid"]),
+    "strategies": strategy_summaries,
+}
+PRICE_INDEPENDENT_NODES = {name for name in COMPUTE_NODES if name.startswith("positions")}
+
+
+# --- 월말 성과 스냅샷: 성과 시트 형식 (기준일 × 전략) 행을 기준일 경로로 계산 ---
+PERFORMANCE_COLUMNS = ["기준일", "전략", "평가액", "누적수익", "월간수익", "월간수익률", "운용증가"]
+PERFORMANCE_STRATEGY_NAMES = {
+    "US Market Index": "US Market",
+    "US AI Power & Grid": "US AI Power",
+    "US Managed WRAP": "US Wrap",
+    "KR Index Leverage": "KR Leverage",
+    "KR Sector ETFs": "KR Sector",
+}
+
+def open_performance_store():
+    """일봉 저장소와 같은 파일의 월말 성과 테이블"""
+    db = open_price_store()
+    db.execute(
+        "CREATE TABLE IF NOT EXISTS performance (date TEXT, strategy TEXT, value REAL, profit REAL, "
+        "monthly_profit REAL, monthly_rate REAL, capital_change REAL, PRIMARY KEY (date, strategy))"
+    )
+    return db
+
+def read_stored_performance():
+    db = open_performance_store()
+    try:
+        rows = db.execute("SELECT * FROM performance ORDER BY date, strategy").fetchall()
+    finally:
+        db.close()
+
+    performance_df = pd.DataFrame(rows, columns=PERFORMANCE_COLUMNS)
+    performance_df["기준일"] = pd.to_datetime(performance_df["기준일"])
+    for col in PERFORMANCE_COLUMNS[2:]:
+        performance_df[col] = pd.to_numeric(performance_df[col])
+    return performance_df
+
+def save_performance(rows):
+    """월말 행 저장 (같은 기준일·전략은 교체)"""
+    db = open_performance_store()
+    try:
+        with db:
+            db.executemany(
+                "INSERT OR REPLACE INTO performance VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (f"{date:%Y-%m-%d}", strategy, *(None if pd.isna(v) else float(v) for v in values))
+                    for date, strategy, *values in rows[PERFORMANCE_COLUMNS].itertuples(index=False)
+                ],
+            )
+    finally:
+        db.close()
+
+def performance_history(snapshot):
+    """월말 성과 (기준일 × 전략): 성과 시트 + 로컬 저장소 (같은 월은 시트 우선)
+    시트를 읽지 못하면 저장소만 사용 (저장소도 비어 있으면 시트 예외)"""
+    stored = read_stored_performance()
+    try:
+        sheet_df = snapshot.sheet("성과")
+    except Exception:
+        if stored.empty:
+            raise
+        return stored
+
+    stored = stored[~stored["기준일"].dt.to_period("M").isin(sheet_df["기준일"].dt.to_period("M"))]
+    if stored.empty:
+        return sheet_df
+    return pd.concat([sheet_df, stored], ignore_index=True)
+
+def monthly_totals(performance_df):
+    """기준일별 평가액·누적수익·월간수익 합계 (최근 월부터)
+    Total 행은 전략 합계라 다시 더하지 않음
+    평가액이 빈 전략이 있는 월(WRAP 이력 없이 채운 월말)은 부분=True, 합계는 비움"""
+    strategy_rows = performance_df[performance_df["전략"] != "Total"]
+    totals = strategy_rows.groupby("기준일").agg({
+        "평가액": "sum",
+        "누적수익": "sum",
+        "월간수익": "sum"
+    })
+    totals["부분"] = strategy_rows["평가액"].isna().groupby(strategy_rows["기준일"]).any()
+    totals[["평가액", "누적수익", "월간수익"]] = totals[["평가액", "누적수익", "월간수익"]].mask(totals["부분"], axis=0)
+    return totals.reset_index().sort_values("기준일", ascending=False)
+
+class PerformanceIndex:
+    """월말 성과 (기준일 × 전략 × 항목) 피벗: 한 번 만들고 조회는 dict 인덱싱
+    같은 기준일·전략 행이 여럿이면 첫 행 사용"""
+
+    def __init__(self, performance_df):
+        rows = performance_df.drop_duplicates(["기준일", "전략"], keep="first")
+        metrics = [col for col in PERFORMANCE_COLUMNS[2:] if col in rows.columns]
+        self.cells = rows.set_index(["기준일", "전략"])[metrics].to_dict(orient="index")
+
+    def get(self, date, strategy, metric, default=0):
+        """없거나 비어 있으면 default"""
+        value = self.cells.get((date, strategy), {}).get(metric)
+        return default if value is None or pd.isna(value) else value
+
+def performance_rows(month_end, strategies, prev_month):
+    """전략 요약 → 성과 시트 형식 행 (전략 5종 + Total)
+    월간수익 = 누적수익 증가분, 월간수익률 = 월간수익 / 전월 평가액, 운용증가 = 평가액 증가분 - 월간수익
+    prev_month: 전월 성과 행 (없는 전략은 월간 항목을 비움)"""
+    prev_rows = {row["전략"]: row for _, row in prev_month.iterrows()}
+    rows = [
+        {"전략": PERFORMANCE_STRATEGY_NAMES[strategy["name"]], "평가액": strategy["value"], "누적수익": strategy["profit"]}
+        for strategy in strategies
+    ]
+    rows.append({
+        "전략": "Total",
+        "평가액": sum(row["평가액"] for row in rows),
+        "누적수익": sum(row["누적수익"] for row in rows),
+    })
+
+    for row in rows:
+        row["기준일"] = month_end
+        prev = prev_rows.get(row["전략"])
+        if prev is None:
+            row["월간수익"] = row["월간수익률"] = row["운용증가"] = np.nan
+            continue
+        row["월간수익"] = row["누적수익"] - prev["누적수익"]
+        row["월간수익률"] = row["월간수익"] / prev["평가액"] if prev["평가액"] else np.nan
+        row["운용증가"] = row["평가액"] - prev["평가액"] - row["월간수익"]
+    return pd.DataFrame(rows, columns=PERFORMANCE_COLUMNS)
+
+def missing_month_ends(snapshot, recorded, today):
+    """기록되지 않은 완료 월의 말일 (가장 이른 기록 월 또는 첫 거래월부터 전월까지)"""
+    first_dates = [df["거래일"].min() for df in snapshot.trade_dfs.values() if not df.empty]
+    first_dates = [date for date in first_dates if pd.notna(date)]
+    if not recorded.empty:
+        first_dates = [recorded["기준일"].min()]
+    if not first_dates:
+        return []
+
+    recorded_months = set(recorded["기준일"].dt.to_period("M"))
+    months = pd.period_range(min(first_dates).to_period("M"), today.to_period("M") - 1, freq="M")
+    return [month.end_time.normalize() for month in months if month not in recorded_months]
+
+def record_month_ends(snapshot, today=None):
+    """빠진 월말 성과를 기준일 경로로 계산해 로컬 저장소에 추가 → 추가된 행
+    월마다 바로 저장하므로 중간에 실패해도 계산한 월은 유지
+    WRAP은 월별 이력이 없어 시트의 현재 평가액·원금을 직전 월말에만 사용하고 (월초 실행 전제),
+    그 이전 월은 WRAP과 Total을 비워 둠"""
+    today = pd.Timestamp(today or current_date())
+    last_month_end = (today.to_period("M") - 1).end_time.normalize()
+    recorded = performance_history(snapshot)
+    month_ends = missing_month_ends(snapshot, recorded, today)
+    if not month_ends:
+        return pd.DataFrame(columns=PERFORMANCE_COLUMNS).astype({"기준일": "datetime64[ns]"})
+
+    trace = current_trace()
+    codes, us_codes = price_universe(snapshot.trade_dfs)
+    # 전체 구간 일봉을 한 번에 채워 두면 월별 조회는 저장소에서 응답
+    with trace.span("month_end:prices"):
+        refresh_due(tuple(codes) + (FX_CODE,), tuple(us_codes),
+                    month_ends[0] - timedelta(days=PRICE_LOOKBACK_DAYS), month_ends[-1])
+
+    added = []
+    for month_end in month_ends:
+        with trace.span(f"month_end:{month_end:%Y-%m}"):
+            overview = PortfolioGraph(prepare_inputs(snapshot, month_end, True)).compute("strategies")
+        if overview["warnings"]:
+            raise RuntimeError(f"{month_end:%Y-%m} 월말 성과 계산 중단: {'; '.join(overview['warnings'])}")
+
+        strategies = overview["strategies"]
+        if month_end != last_month_end:
+            strategies = [
+                {**strategy, "value": np.nan, "profit": np.nan} if strategy["name"] == "US Managed WRAP" else strategy
+                for strategy in strategies
+            ]
+
+        prev_month = recorded[recorded["기준일"].dt.to_period("M") == month_end.to_period("M") - 1]
+        rows = performance_rows(month_end, strategies, prev_month)
+        save_performance(rows)
+        recorded = pd.concat([recorded, rows], ignore_index=True)
+        added.append(rows)
+    return pd.concat(added, ignore_index=True)